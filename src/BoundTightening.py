@@ -0,0 +1,101 @@
+# Bound-tightening pre-pass for the model of create_model.
+# Many variables are created with lb=-inf and no upper bound. Valid bounds follow from the physics: the
+# transformer capacity s_trafo, the line ratings Inom, the device ratings p_hp_max / p_boil_max and the indoor
+# thermal dynamics. Applying them as variable bounds shrinks the SOC relaxation and the branch-and-bound tree.
+# The b_hp binaries of users without a heat pump (hp_own == 0) are fixed to 0.
+#
+# All bounds are recomputed from model_inf every call, so the pass can be re-applied after a data update
+# (e.g. on a model read from ModelCache).
+
+import numpy as np
+
+from src.ThermalModel import indoor_temperature, ppd_curve
+
+# relative safety margin on derived (not exact) bounds, keeps them valid under floating point round-off
+MARGIN = 1e-6
+
+
+def _widen(lb, ub):
+    return lb - MARGIN * np.maximum(1.0, np.abs(lb)), ub + MARGIN * np.maximum(1.0, np.abs(ub))
+
+
+def _set_bounds(m, group, lb, ub, rows, Time_day):
+    # lb, ub: arrays broadcastable to (rows, Time_day)
+    lb = np.broadcast_to(lb, (rows, Time_day))
+    ub = np.broadcast_to(ub, (rows, Time_day))
+    variables = [group[i, t] for i in range(rows) for t in range(Time_day)]
+    m.setAttr("LB", variables, lb.ravel().tolist())
+    m.setAttr("UB", variables, ub.ravel().tolist())
+
+
+def derive_bounds(Time_day, model_inf, pv_ef, IFRC=True):
+    """
+    Returns a dict of variable group -> (lb, ub) arrays derived from the model data.
+
+    :param pv_ef: pv output factor per time step, as used in create_model
+    """
+    n_user = model_inf.n_user
+    inf = float("inf")
+    hp_own = np.asarray(model_inf.hp_own, dtype=float)[:, None]
+    pv = model_inf.pv_cap[:, None] * np.asarray(pv_ef, dtype=float)[None, :]
+    p_load = model_inf.p_load[:, :Time_day]
+    bounds = {}
+
+    # devices
+    p_hp_max = model_inf.p_hp_max * hp_own
+    h_hp_max = model_inf.COP * p_hp_max
+    heat_max = np.maximum(h_hp_max, model_inf.p_boil_max)  # heat pump and boiler never run together
+    bounds["p_hp"] = (0.0, p_hp_max)
+    bounds["q_hp"] = (0.0, p_hp_max * model_inf.tan_phi_load)
+    bounds["h_hp"] = (0.0, h_hp_max)
+    bounds["h_boil"] = (0.0, model_inf.p_boil_max)
+    bounds["g_boil"] = (0.0, 1e3 * model_inf.p_boil_max / (4 * model_inf.gas_LHV))
+    bounds["Heat"] = (0.0, heat_max)
+    bounds["b_hp"] = (0.0, np.where(hp_own > 0, 1.0, 0.0))
+
+    # bus injections: slack bus from the transformer, user buses from load, pv and heat pump
+    p_lb = np.zeros((model_inf.n_bus, Time_day))
+    p_ub = np.zeros((model_inf.n_bus, Time_day))
+    q_lb = np.zeros((model_inf.n_bus, Time_day))
+    q_ub = np.zeros((model_inf.n_bus, Time_day))
+    s = model_inf.s_trafo
+    p_lb[0] = np.maximum(-s, model_inf.congestion_limit[:Time_day])
+    p_ub[0], q_lb[0], q_ub[0] = s, -s, s
+    user_bus = np.flatnonzero(model_inf.bus_user >= 0)
+    users = model_inf.bus_user[user_bus]
+    p_lb[user_bus], p_ub[user_bus] = _widen(p_load[users] - pv[users], p_load[users] - pv[users] + p_hp_max[users])
+    q_pv = pv[users] * model_inf.tan_phi_pv
+    q_lb[user_bus], q_ub[user_bus] = _widen(-q_pv, -q_pv + p_hp_max[users] * model_inf.tan_phi_load)
+    bounds["p"] = (p_lb, p_ub)
+    bounds["q"] = (q_lb, q_ub)
+
+    # lines: PLine^2 + QLine^2 <= l * v with l <= 1.5 Inom^2 and v <= (v_ub v_ref)^2
+    l_max = 1.5 * model_inf.line_Inom[:, None] ** 2
+    flow_max = np.sqrt(l_max) * model_inf.v_ub * model_inf.v_ref
+    bounds["l"] = (0.0, l_max)
+    bounds["PLine"] = _widen(-flow_max, flow_max)
+    bounds["QLine"] = _widen(-flow_max, flow_max)
+
+    # indoor temperature: the dynamics are monotone in Heat, so no heating / full heating bound every trajectory
+    T_lo = indoor_temperature(model_inf, np.zeros((n_user, Time_day)), IFRC)
+    T_hi = indoor_temperature(model_inf, np.broadcast_to(heat_max, (n_user, Time_day)), IFRC)
+    T_lo, T_hi = _widen(T_lo, T_hi)
+    T_lo = np.maximum(T_lo, 0.0)
+    bounds["T_ind"] = (T_lo, T_hi)
+
+    # PPD >= convex piecewise curve of T_ind: its minimum over [T_lo, T_hi] is a lower bound. With a positive
+    # PPD_Price every optimal solution has PPD on the curve, so its maximum over the range is an upper bound.
+    breakpoints = np.clip(np.asarray(model_inf.x_vals, dtype=float), T_lo[..., None], T_hi[..., None])
+    curve = np.concatenate([ppd_curve(model_inf, T_lo)[..., None], ppd_curve(model_inf, T_hi)[..., None],
+                            ppd_curve(model_inf, breakpoints)], axis=-1)
+    PPD_lb, PPD_ub = _widen(curve.min(axis=-1), curve.max(axis=-1))
+    bounds["PPD"] = (np.maximum(PPD_lb, 0.0), PPD_ub if model_inf.PPD_Price > 0 else inf)
+    return bounds
+
+
+def tighten_bounds(m, variables, Time_day, model_inf, pv_ef, IFRC=True):
+    """Applies derive_bounds to the variables of create_model (dict as returned by create_model)."""
+    for name, (lb, ub) in derive_bounds(Time_day, model_inf, pv_ef, IFRC).items():
+        rows = len(variables[name]) // Time_day
+        _set_bounds(m, variables[name], lb, ub, rows, Time_day)
+    m.update()
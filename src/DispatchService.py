@@ -0,0 +1,417 @@
+# Local asyncio dispatch service around build_model.
+# Requests ("congestion limit profile X for date D") are put on a queue and solved by a bounded pool of
+# solver workers. Identical requests are deduplicated and answered from a result cache, running solves can be
+# cancelled (the best incumbent found so far, if any, is returned), and per-request latency and queue depth are
+# exposed.
+#
+# The API is plain HTTP/1.1 with JSON bodies, served on 127.0.0.1 or on a Unix socket:
+#   POST /solve              {"date": "2024-02-01", "congestion_limit": [...], "time_day": 96, "wait": false}
+#   GET  /jobs/<id>          job status, latency and (when finished) schedules and costs
+#   POST /jobs/<id>/cancel   stop a queued or running job
+#   GET  /metrics            queue depth, running jobs, cache statistics and latency summary
+#
+# Inputs of date D: the prices of D, and the weather and PV data of D from the preprocessed file of
+# WeatherPreprocess.py when it exists and covers D. Base load, network and users are always the data of
+# REFERENCE_DAY. Every job reports which fields were taken from D under "inputs".
+#
+# run from the repository root:  python -m src.DispatchService --port 8765 --workers 2
+
+import argparse
+import asyncio
+import collections
+import datetime
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
+
+import gurobipy as gp
+from gurobipy import GRB
+
+from src.Model import create_model, extract_results, set_objective, solve_model
+from src.ModelData import compact_model_inf
+from src.OpfModel import add_opf_constraints
+from src.HHPmodel import add_hhp_constraints
+from src.ThermalModel import add_indoor_constraints
+from src.WeatherPreprocess import DailyInputs
+
+# day of the load, temperature and PV data loaded by Parameter.py
+REFERENCE_DAY = "2024-02-01"
+
+# schedules returned to the caller, taken from the dict_optimizedResults of build_model
+RESULT_KEYS = ["p", "q", "v_value", "p_hp", "p_pv", "T_ind", "h_boil", "PPD", "power_cost", "gas_cost", "PPD_cost"]
+
+
+class Job:
+    def __init__(self, job_id, key, params, inputs):
+        self.job_id = job_id
+        self.key = key
+        self.params = params
+        self.inputs = inputs
+        self.status = "queued"  # queued, running, done, cancelled, failed
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.done = asyncio.get_running_loop().create_future()
+        self.submitted = time.monotonic()
+        self.started = None
+        self.finished = None
+
+    def latency(self):
+        """Returns queue wait, solve time and total latency in seconds (None while not yet known)."""
+        now = time.monotonic()
+        start = self.started if self.started is not None else (self.finished or now)
+        end = self.finished if self.finished is not None else now
+        return {
+            "queue_wait": start - self.submitted,
+            "solve_time": end - self.started if self.started is not None else None,
+            "total": end - self.submitted,
+        }
+
+    def to_dict(self, with_result=True):
+        info = {"job": self.job_id, "status": self.status, "params": self.params, "inputs": self.inputs,
+                "latency": self.latency()}
+        if self.error is not None:
+            info["error"] = self.error
+        if with_result and self.result is not None:
+            info["result"] = self.result
+        return info
+
+
+def normalize_request(request, default_time_day=96, max_time_day=96):
+    """
+    Validates a solve request and returns its canonical parameters.
+
+    :param request:          dict with "date" ("YYYY-MM-DD"), "congestion_limit" (MW per time step) and optionally
+                             "time_day"
+    :param default_time_day: number of time steps used when the request does not specify one
+    :param max_time_day:     length of the input series (one day of 15 min steps)
+    """
+    time_day = int(request.get("time_day", default_time_day))
+    if not 0 < time_day <= max_time_day:
+        raise ValueError(f"time_day must be between 1 and {max_time_day}")
+    params = {"date": None, "time_day": time_day, "congestion_limit": None}
+    if request.get("date") is not None:
+        params["date"] = datetime.date.fromisoformat(str(request["date"])).isoformat()
+    if request.get("congestion_limit") is not None:
+        limit = [float(x) for x in request["congestion_limit"]]
+        if len(limit) < time_day:
+            raise ValueError(f"congestion_limit needs at least {time_day} values, got {len(limit)}")
+        params["congestion_limit"] = limit[:time_day]
+    return params
+
+
+def request_key(params):
+    """Hash of the canonical request parameters, used to deduplicate identical requests."""
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+class DispatchService:
+    def __init__(self, workers=2, threads_per_worker=0, cache_size=128, model_inf_factory=None,
+                 daily_inputs="data/preprocessed/inputs", history_size=1000):
+        """
+        :param workers:            Number of concurrent solves
+        :param threads_per_worker: Gurobi Threads parameter for every solve (0 lets gurobi decide)
+        :param cache_size:         Number of finished results kept for identical requests
+        :param history_size:       Number of finished jobs kept for GET /jobs/<id>; older ones are forgotten
+        :param model_inf_factory:  Callable(date=..., congestion_limit=...) returning a ModelInf with the prices
+                                   of date (defaults to src.Parameter.get_model_inf)
+        :param daily_inputs:       Path of the WeatherPreprocess output (used when it exists), a DailyInputs, or
+                                   None to take weather and PV data from REFERENCE_DAY for every date
+        """
+        if model_inf_factory is None:
+            from src.Parameter import get_model_inf
+            model_inf_factory = get_model_inf
+        if isinstance(daily_inputs, str):
+            daily_inputs = DailyInputs(daily_inputs) if os.path.exists(daily_inputs + ".json") else None
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.cache_size = cache_size
+        self.history_size = history_size
+        self.model_inf_factory = model_inf_factory
+        self.daily_inputs = daily_inputs
+
+        self._ids = itertools.count(1)
+        self._queue = None
+        self._tasks = []
+        self._jobs = {}                            # job id -> queued, running or recently finished job
+        self._history = collections.OrderedDict()  # finished job ids, oldest first
+        self._inflight = {}                        # request key -> queued or running job
+        self._cache = collections.OrderedDict()    # request key -> finished job (LRU)
+        self._latencies = collections.deque(maxlen=1000)
+        self._cache_hits = 0
+        self._dedup_hits = 0
+        self._running = 0
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for job in self._inflight.values():
+            job.cancel_event.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, request):
+        """Queues a request and returns (job, how), where how is "new", "deduplicated" or "cached"."""
+        params = normalize_request(request)
+        key = request_key(params)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self._cache_hits += 1
+            job = self._cache[key]
+            # a cached job may have left the history already, answering it makes it recent again
+            self._remember(job)
+            return job, "cached"
+        if key in self._inflight:
+            self._dedup_hits += 1
+            return self._inflight[key], "deduplicated"
+
+        job = Job(str(next(self._ids)), key, params, self.input_sources(params["date"]))
+        self._jobs[job.job_id] = job
+        self._inflight[key] = job
+        self._queue.put_nowait(job)
+        return job, "new"
+
+    def day_fields(self, date):
+        """Weather and PV fields of CompactModelInf available for date in the preprocessed inputs."""
+        if date is None or self.daily_inputs is None or date not in self.daily_inputs:
+            return {}
+        return self.daily_inputs.model_inf_fields(date)
+
+    def input_sources(self, date):
+        """Which inputs of a solve come from the requested date; all others are the data of REFERENCE_DAY."""
+        if date is None:
+            return {"date": REFERENCE_DAY, "from_date": [], "reference_day": REFERENCE_DAY}
+        from_date = {"ele_price", "gas_price"} | set(self.day_fields(date))
+        return {"date": date, "from_date": sorted(from_date), "reference_day": REFERENCE_DAY}
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancels a job. A running solve is terminated and returns its best incumbent."""
+        job = self._jobs.get(job_id)
+        if job is None or job.status not in ("queued", "running"):
+            return job
+        job.cancel_event.set()
+        if job.status == "queued":
+            self._finish(job, "cancelled")
+        return job
+
+    def metrics(self):
+        latencies = sorted(self._latencies)
+
+        def quantile(q):
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else None
+
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "running": self._running,
+            "workers": self.workers,
+            "jobs": len(self._jobs),
+            "cache_size": len(self._cache),
+            "cache_hits": self._cache_hits,
+            "dedup_hits": self._dedup_hits,
+            "latency": {
+                "count": len(latencies),
+                "mean": sum(latencies) / len(latencies) if latencies else None,
+                "p50": quantile(0.5),
+                "p95": quantile(0.95),
+                "max": latencies[-1] if latencies else None,
+            },
+        }
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.status != "queued":
+                    continue
+                job.status = "running"
+                job.started = time.monotonic()
+                self._running += 1
+                try:
+                    result = await loop.run_in_executor(None, self._solve, job)
+                except Exception as exc:
+                    job.error = str(exc)
+                    self._finish(job, "failed")
+                else:
+                    job.result = result
+                    self._finish(job, "cancelled" if job.cancel_event.is_set() else "done")
+                finally:
+                    self._running -= 1
+            finally:
+                self._queue.task_done()
+
+    def _remember(self, job):
+        self._jobs[job.job_id] = job
+        self._history[job.job_id] = None
+        self._history.move_to_end(job.job_id)
+        while len(self._history) > self.history_size:
+            job_id, _ = self._history.popitem(last=False)
+            self._jobs.pop(job_id, None)
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished = time.monotonic()
+        self._latencies.append(job.finished - job.submitted)
+        self._inflight.pop(job.key, None)
+        # memory stays bounded by history_size + cache_size finished jobs
+        self._remember(job)
+        # only complete solves are reused, a cancelled job only holds an incumbent
+        if status == "done":
+            self._cache[job.key] = job
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        if not job.done.done():
+            job.done.set_result(job)
+
+    def _solve(self, job):
+        # runs in an executor thread; every solve gets its own gurobi environment
+        params = job.params
+        model_inf = self.model_inf_factory(date=params["date"], congestion_limit=params["congestion_limit"])
+
+        def callback(model, where):
+            if job.cancel_event.is_set():
+                model.terminate()
+
+        Time_day = params["time_day"]
+        model_inf = compact_model_inf(model_inf).replace(**self.day_fields(params["date"]))
+        with gp.Env(params={"LogToConsole": 0, "Threads": self.threads_per_worker}) as env:
+            m, variables = create_model(Time_day, model_inf, add_opf_constraints, add_hhp_constraints,
+                                        add_indoor_constraints, env=env)
+            objective_parts = set_objective(m, variables, Time_day, model_inf)
+            # one log file per job, concurrent workers would otherwise all write to GEC.log
+            solve_model(m, callback, {"LogFile": f"GEC_job{job.job_id}.log"})
+            if m.SolCount == 0:
+                status = m.Status
+                m.dispose()
+                if job.cancel_event.is_set():
+                    # cancelled before the first incumbent, there is no schedule to return
+                    return None
+                raise RuntimeError(f"no feasible solution found (model status {status})")
+            dict_optimizedResults = extract_results(variables, objective_parts, Time_day, model_inf)
+            result = {key: dict_optimizedResults[key] for key in RESULT_KEYS}
+            result["objective"] = m.ObjVal
+            result["model_status"] = m.Status
+            result["optimal"] = m.Status == GRB.OPTIMAL
+            result["mip_gap"] = m.MIPGap
+            result["runtime"] = m.Runtime
+            m.dispose()
+        return result
+
+
+# --- HTTP front end -------------------------------------------------------------------------------------
+
+REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+
+
+async def read_http_request(reader):
+    request_line = (await reader.readline()).decode("latin-1").strip()
+    if not request_line:
+        return None
+    method, path, _ = request_line.split(" ", 2)
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1").strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return method, path, body
+
+
+def parse_body(body):
+    """Decodes a JSON request body; raises ValueError when it is not a JSON object."""
+    request = json.loads(body) if body else {}
+    if not isinstance(request, dict):
+        raise ValueError("request body must be a JSON object")
+    return request
+
+
+async def write_http_response(writer, code, payload):
+    body = json.dumps(payload).encode()
+    head = (f"HTTP/1.1 {code} {REASONS.get(code, '')}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n")
+    writer.write(head.encode("latin-1") + body)
+    await writer.drain()
+
+
+async def handle_request(service, method, path, body):
+    """Routes one API call and returns (HTTP code, JSON payload)."""
+    parts = [part for part in path.split("?")[0].split("/") if part]
+    if parts == ["solve"] and method == "POST":
+        job, how = service.submit(body)
+        if body.get("wait"):
+            await asyncio.shield(job.done)
+        info = job.to_dict()
+        info["submitted"] = how
+        return (200 if job.done.done() else 202), info
+    if parts == ["metrics"] and method == "GET":
+        return 200, service.metrics()
+    if len(parts) >= 2 and parts[0] == "jobs":
+        job = service.get(parts[1])
+        if job is None:
+            return 404, {"error": f"unknown job {parts[1]}"}
+        if len(parts) == 2 and method == "GET":
+            return 200, job.to_dict()
+        if parts[2:] == ["cancel"] and method == "POST":
+            service.cancel(job.job_id)
+            return 200, job.to_dict(with_result=False)
+    return 404, {"error": f"no route for {method} {path}"}
+
+
+async def serve(service, host="127.0.0.1", port=8765, unix_path=None):
+    """Starts the service and serves the HTTP API on host:port, or on unix_path when given."""
+
+    async def on_connection(reader, writer):
+        try:
+            request = await read_http_request(reader)
+            if request is not None:
+                method, path, body = request
+                try:
+                    code, payload = await handle_request(service, method, path, parse_body(body))
+                except (ValueError, TypeError, KeyError) as exc:
+                    code, payload = 400, {"error": str(exc)}
+                await write_http_response(writer, code, payload)
+        finally:
+            writer.close()
+
+    await service.start()
+    if unix_path:
+        server = await asyncio.start_unix_server(on_connection, path=unix_path)
+    else:
+        server = await asyncio.start_server(on_connection, host=host, port=port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local dispatch service for the congestion management model")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", default=None, help="serve on this Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=0, help="gurobi threads per solve")
+    parser.add_argument("--cache-size", type=int, default=128)
+    parser.add_argument("--history-size", type=int, default=1000, help="finished jobs kept for GET /jobs/<id>")
+    parser.add_argument("--inputs", default="data/preprocessed/inputs",
+                        help="daily weather and PV inputs written by src.WeatherPreprocess")
+    args = parser.parse_args()
+
+    service = DispatchService(workers=args.workers, threads_per_worker=args.threads, cache_size=args.cache_size,
+                              daily_inputs=args.inputs, history_size=args.history_size)
+    asyncio.run(serve(service, host=args.host, port=args.port, unix_path=args.unix))
@@ -1,28 +1,39 @@
 # this is the overall model, which first defines the variables, then the constraints, and finally the objective function
 #the constrains are divided into three parts: opf, hhp, and indoor, in the following functions-mudule files:
 #add_opf_constraints from OpfModel.py, add_hhp_constraints from HHPmodel.py, add_indoor_constraints from ThermalModel.py
+#build_model runs the stages create_model -> set_objective -> solve_model -> extract_results, which can also be used separately
 
 import gurobipy as gp
 from gurobipy import GRB,quicksum
 
+from src.BoundTightening import tighten_bounds
+from src.ModelData import compact_model_inf
 
 
-def build_model(Time_day, model_inf, add_opf_constraints, add_hhp_constraints, add_indoor_constraints):
-    
 
-    
+def pv_efficiency(model_inf, t):
+    # pv output factor of time step t, pv is switched off (*0) in the current studies
+    return model_inf.pv_factor[t]*0
 
-    
-    n_bus=len(model_inf.network)+1
-    user_index=model_inf.connect1["Node"].tolist()
-    n_user= len(user_index)  #in DACS7, last one's load is 0
 
-    pv_cap=model_inf.connect1["PV"]*1E-3 #pv capacity from dacs data
-    pv_cap=pv_cap.tolist()
+def create_model(Time_day, model_inf, add_opf_constraints, add_hhp_constraints, add_indoor_constraints, env=None, IFRC=True, tighten=True):
+    # builds variables and constraints (no objective) and returns the model and a dict with its variables
+    # env: optional gurobi environment, one per thread when models are solved concurrently
+    # IFRC: simple RC indoor model if True, state-space model otherwise
+    # tighten: apply the physics based variable bounds of BoundTightening.py
 
-    
+    # pandas based ModelInf is converted once into contiguous arrays with precomputed index maps
+    model_inf = compact_model_inf(model_inf)
+
+    n_bus=model_inf.n_bus
+    n_user=model_inf.n_user  #in DACS7, last one's load is 0
+    bus_user=model_inf.bus_user.tolist()  #user of every bus, -1 if no user is connected
 
-    m = gp.Model("GEC")
+    pv_cap=model_inf.pv_cap.tolist() #pv capacity from dacs data
+    p_load=model_inf.p_load.tolist() #users x time, MW
+    q_load=model_inf.q_load.tolist()
+
+    m = gp.Model("GEC", env=env)
     m.Params.LogToConsole = 0
 
     # define variables
@@ -64,35 +75,53 @@ def build_model(Time_day, model_inf, add_opf_constraints, add_hhp_constraints, a
     # define constraints
     for t in range(Time_day):
             run_time=t
-            pv_ef=model_inf.pvFactor.at[run_time,"Quarter_Hourly_Data"]*0
+            pv_ef=pv_efficiency(model_inf, run_time)
             # p_baseload=model_inf.LoadPower['usage_total_pu'].values/10
             # p_baseload=p_baseload.tolist()
             load_factor=1
             # if t>=67 and t<=75:
             #     load_factor=1.5
-            p_baseload=model_inf.LoadPower.iloc[run_time,1:]*1E-3*load_factor
-            p_baseload=p_baseload.tolist()
-            q_baseload=model_inf.LoadReact.iloc[run_time,1:]*1E-3*load_factor
-            q_baseload=q_baseload.tolist()
+            p_baseload=[p_load[u][run_time]*load_factor for u in range(n_user)]
+            q_baseload=[q_load[u][run_time]*load_factor for u in range(n_user)]
 
             add_opf_constraints(m, PLine, QLine, l, v, p, q, model_inf, n_bus, t,slack_pos,slack_neg,slack_vol_pos,slack_vol_neg,slack_line,powerlimit)
             add_hhp_constraints(m, p_hp, h_hp, b_hp, g_boil, h_boil, b_boil, Heat, model_inf, n_user, t)
-            add_indoor_constraints(m, T_ind, model_inf, Heat, PPD, n_user, t, True)
+            add_indoor_constraints(m, T_ind, model_inf, Heat, PPD, n_user, t, IFRC)
 
             
             for i in range(n_bus):
-                if i not in user_index and i != 0:
+                u = bus_user[i]
+                if u < 0 and i != 0:
                     m.addConstr(p[i,t] == 0,"busP=0")
                     m.addConstr(q[i,t] == 0,"busQ=0")
-                if i in user_index:
-                    m.addConstr(p[i,t] ==  p_baseload[i-(n_bus-n_user)] - p_pv[i-(n_bus-n_user),t] + p_hp[i-(n_bus-n_user),t], "LoadP")
-                    # m.addConstr(q[i,t] ==  q_baseload[i-(n_bus-n_user)]  - q_pv[i-(n_bus-n_user),t] + q_hp[i-(n_bus-n_user),t], "LoadQ")
-                    m.addConstr(q[i,t] ==    - q_pv[i-(n_bus-n_user),t] + q_hp[i-(n_bus-n_user),t], "LoadQ")
+                if u >= 0:
+                    m.addConstr(p[i,t] ==  p_baseload[u] - p_pv[u,t] + p_hp[u,t], f"LoadP{i,t}")
+                    # m.addConstr(q[i,t] ==  q_baseload[u]  - q_pv[u,t] + q_hp[u,t], "LoadQ")
+                    m.addConstr(q[i,t] ==    - q_pv[u,t] + q_hp[u,t], "LoadQ")
 
             for i in range(n_user):        
                 m.addConstr(q_pv[i,t] == p_pv[i,t] * model_inf.tan_phi_pv,"pv_tan")
                 m.addConstr(q_hp[i,t] == p_hp[i,t] * model_inf.tan_phi_load,"hp_tan")         
-                m.addConstr(p_pv[i,t] == pv_cap[i]*pv_ef,"pvMax")
+                m.addConstr(p_pv[i,t] == pv_cap[i]*pv_ef,f"pvMax{i,t}")
+
+    m.update()
+    variables = {
+    "p": p, "q": q, "PLine": PLine, "QLine": QLine, "v": v, "l": l,
+    "p_pv": p_pv, "q_pv": q_pv, "p_hp": p_hp, "q_hp": q_hp, "p_pv_down": p_pv_down, "b_hp": b_hp, "p_hp_down": p_hp_down,
+    "h_hp": h_hp, "g_boil": g_boil, "h_boil": h_boil, "b_boil": b_boil, "Heat": Heat, "T_ind": T_ind, "PPD": PPD,
+    "powerlimit": powerlimit,
+    "slack_pos": slack_pos, "slack_neg": slack_neg, "slack_vol_pos": slack_vol_pos, "slack_vol_neg": slack_vol_neg, "slack_line": slack_line
+    }
+    if tighten:
+        tighten_bounds(m, variables, Time_day, model_inf, [pv_efficiency(model_inf, t) for t in range(Time_day)], IFRC)
+    return m, variables
+
+
+def set_objective(m, variables, Time_day, model_inf):
+    # sets the cost objective and returns its three parts (power_cost, gas_cost, PPD_cost)
+    model_inf = compact_model_inf(model_inf)
+    n_user = model_inf.n_user
+    p, g_boil, PPD = variables["p"], variables["g_boil"], variables["PPD"]
 
     # define objective
     power_cost=quicksum(1e3*model_inf.ele_price[int(t/4)]*(-p[0,t])*0.25  for t in range(Time_day) )
@@ -110,11 +139,18 @@ def build_model(Time_day, model_inf, add_opf_constraints, add_hhp_constraints, a
 
   
     m.setObjective(obj, GRB.MINIMIZE)
+    return power_cost, gas_cost, PPD_cost
+
 
+def solve_model(m, callback=None, params=None):
+    # callback: optional gurobi callback passed to m.optimize(), e.g. to terminate a long solve
+    # params: optional gurobi parameters overriding the defaults below, e.g. {"Threads": 2, "TimeLimit": 300}
     m.Params.MIPGap = 0.05
     m.Params.TimeLimit = 600  # Set time limit to 10 minutes
     m.Params.LogFile = "GEC.log"
-    m.optimize()
+    for name, value in (params or {}).items():
+        m.setParam(name, value)
+    m.optimize(callback)
 
 
     print(f"Optimization Runtime: {m.Runtime} seconds")
@@ -125,6 +161,14 @@ def build_model(Time_day, model_inf, add_opf_constraints, add_hhp_constraints, a
         print(f"Model status: {m.status}")
 
 
+def extract_results(variables, objective_parts, Time_day, model_inf):
+    model_inf = compact_model_inf(model_inf)
+    n_bus, n_user = model_inf.n_bus, model_inf.n_user
+    p, q, v = variables["p"], variables["q"], variables["v"]
+    p_hp_down, p_hp, p_pv_down, p_pv = variables["p_hp_down"], variables["p_hp"], variables["p_pv_down"], variables["p_pv"]
+    T_ind, h_boil, PPD = variables["T_ind"], variables["h_boil"], variables["PPD"]
+    power_cost, gas_cost, PPD_cost = objective_parts
+
     dict_optimizedResults = {
     "p": [[p[i,t].X  for t in range(Time_day)]for i in range(n_bus)],
     "q": [[q[i,t].X  for t in range(Time_day)] for i in range(n_bus)], 
@@ -142,4 +186,17 @@ def build_model(Time_day, model_inf, add_opf_constraints, add_hhp_constraints, a
     } 
 
 
-    return m,dict_optimizedResults
\ No newline at end of file
+    return dict_optimizedResults
+
+
+def build_model(Time_day, model_inf, add_opf_constraints, add_hhp_constraints, add_indoor_constraints, env=None, callback=None, tighten=True, params=None):
+    # env: optional gurobi environment, one per thread when models are solved concurrently
+    # callback: optional gurobi callback passed to m.optimize(), e.g. to terminate a long solve
+    # tighten: apply the physics based variable bounds of BoundTightening.py before solving
+    # params: optional gurobi parameters for solve_model
+    model_inf = compact_model_inf(model_inf)
+    m, variables = create_model(Time_day, model_inf, add_opf_constraints, add_hhp_constraints, add_indoor_constraints, env=env, tighten=tighten)
+    objective_parts = set_objective(m, variables, Time_day, model_inf)
+    solve_model(m, callback, params)
+    dict_optimizedResults = extract_results(variables, objective_parts, Time_day, model_inf)
+    return m,dict_optimizedResults
@@ -0,0 +1,226 @@
+# Persistent cache of built models.
+# Building the gurobi model in Python is the main cold-start cost of a run. The cache hashes the structural
+# inputs (network, users, Time_day, model options such as IFRC and the code of the constraint functions) and
+# stores the built model as an MPS file, next to a JSON index map of its variables and data-dependent
+# constraints and the constraint names (MPS keeps only generic row names).
+# Later runs with the same structure read the MPS file and only update the data: congestion limit, base load,
+# PV and weather right-hand sides, and the price objective.
+
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+
+import gurobipy as gp
+import numpy as np
+
+from src.BoundTightening import tighten_bounds
+from src.Model import create_model, extract_results, pv_efficiency, set_objective, solve_model
+from src.ModelData import compact_model_inf
+from src.ThermalModel import indoor_rhs
+
+# bump when the layout of the cache files changes; formulation changes are picked up by _hash_code
+FORMAT_VERSION = 4
+
+# inputs that only enter right-hand sides or the objective; everything else is structural
+DATA_FIELDS = ("ele_price", "gas_price", "PPD_Price", "congestion_limit", "p_load", "q_load", "pv_factor", "pv_cap",
+               "T_amb", "Tem_ind", "solar_output", "StartRe", "EndRe")
+
+
+def _hash_code_object(h, code):
+    h.update(code.co_code)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            _hash_code_object(h, const)
+        else:
+            h.update(repr(const).encode())
+
+
+def _hash_code(h, funcs):
+    # the source of every module defining one of funcs, so helpers and module constants (A, B, T_h of
+    # ThermalModel) are covered too; functions without source (defined interactively) by their byte code
+    modules = []
+    for func in funcs:
+        module = inspect.getmodule(func)
+        if module is not None and module not in modules:
+            try:
+                h.update(inspect.getsource(module).encode())
+                modules.append(module)
+                continue
+            except (TypeError, OSError):
+                pass
+        _hash_code_object(h, func.__code__)
+
+
+class ModelCache:
+    def __init__(self, cache_dir="model_cache"):
+        """
+        :param cache_dir: Directory holding the <key>.mps and <key>.json files
+        """
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, Time_day, model_inf, add_opf_constraints, add_hhp_constraints, add_indoor_constraints, IFRC=True,
+            tighten=True):
+        """Hash of the structural model inputs."""
+        model_inf = compact_model_inf(model_inf)
+        h = hashlib.sha256()
+        h.update(repr((FORMAT_VERSION, Time_day, IFRC, tighten)).encode())
+        for func in (add_opf_constraints, add_hhp_constraints, add_indoor_constraints):
+            h.update(f"{func.__module__}.{func.__qualname__}".encode())
+        # a cached model is only valid for the code that built it and the index functions that describe it
+        _hash_code(h, (add_opf_constraints, add_hhp_constraints, add_indoor_constraints, create_model, indoor_rhs,
+                       compact_model_inf, model_index))
+        for name, value in sorted(model_inf.fields().items()):
+            if name in DATA_FIELDS:
+                continue
+            h.update(name.encode())
+            if isinstance(value, np.ndarray):
+                h.update(repr((value.dtype.str, value.shape)).encode())
+                h.update(value.tobytes())
+            else:
+                h.update(repr(float(value)).encode())
+        return h.hexdigest()[:32]
+
+    def _paths(self, key):
+        return os.path.join(self.cache_dir, f"{key}.mps"), os.path.join(self.cache_dir, f"{key}.json")
+
+    def load_or_create(self, Time_day, model_inf, add_opf_constraints, add_hhp_constraints, add_indoor_constraints,
+                       env=None, IFRC=True, tighten=True):
+        """
+        Returns (m, variables, hit): the model without objective, with the data of model_inf applied.
+
+        hit tells whether the model was read from the cache. On a miss the model is built with create_model
+        and stored for the next run.
+        """
+        model_inf = compact_model_inf(model_inf)
+        key = self.key(Time_day, model_inf, add_opf_constraints, add_hhp_constraints, add_indoor_constraints, IFRC,
+                       tighten)
+        mps_path, index_path = self._paths(key)
+
+        if os.path.exists(mps_path) and os.path.exists(index_path):
+            with open(index_path) as f:
+                index = json.load(f)
+            m = gp.read(mps_path, env=env)
+            m.Params.LogToConsole = 0
+            variables = restore_variables(m, index)
+            restore_names(m, index)
+            update_model_data(m, index, model_inf, Time_day, IFRC)
+            if tighten:
+                # the bounds depend on the data as well
+                tighten_bounds(m, variables, Time_day, model_inf,
+                               [pv_efficiency(model_inf, t) for t in range(Time_day)], IFRC)
+            return m, variables, True
+
+        m, variables = create_model(Time_day, model_inf, add_opf_constraints, add_hhp_constraints,
+                                    add_indoor_constraints, env=env, IFRC=IFRC, tighten=tighten)
+        index = model_index(m, variables, Time_day, model_inf, IFRC)
+        check_model_data(m, index, model_inf, Time_day, IFRC)
+
+        # write under unique temporary names first so concurrent runs (processes or threads) never read a
+        # partial file or write to the same one
+        fd, tmp_mps = tempfile.mkstemp(suffix=".mps", dir=self.cache_dir)
+        os.close(fd)
+        m.write(tmp_mps)
+        fd, tmp_index = tempfile.mkstemp(suffix=".json.tmp", dir=self.cache_dir)
+        with os.fdopen(fd, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_mps, mps_path)
+        os.replace(tmp_index, index_path)
+        return m, variables, False
+
+
+def model_index(m, variables, Time_day, model_inf, IFRC=True):
+    """Positions of the variable groups and of the data-dependent constraints of a freshly built model."""
+    n_bus, n_user = model_inf.n_bus, model_inf.n_user
+    index = {"Time_day": Time_day, "IFRC": IFRC, "vars": {}}
+    for name, group in variables.items():
+        if isinstance(group, gp.Var):
+            index["vars"][name] = [group.index, None]
+        else:
+            # addVars(rows, Time_day) creates the variables row by row
+            rows = len(group) // Time_day
+            index["vars"][name] = [group[0, 0].index, rows]
+            assert group[rows - 1, Time_day - 1].index == group[0, 0].index + rows * Time_day - 1
+
+    position = {c.ConstrName: c.index for c in m.getConstrs()}
+    user_bus = [0] * n_user
+    for bus, u in enumerate(model_inf.bus_user.tolist()):
+        if u >= 0:
+            user_bus[u] = bus
+    index["congestion"] = [position[f"TransPowerLimitForCongestion{t}"] for t in range(Time_day)]
+    index["load"] = [[position[f"LoadP{user_bus[u], t}"] for t in range(Time_day)] for u in range(n_user)]
+    index["pv"] = [[position[f"pvMax{u, t}"] for t in range(Time_day)] for u in range(n_user)]
+    index["indoor"] = [[position[f"IndoorTemChange0{u}" if t == 0 else f"IndoorTemChange{u, t}"]
+                        for t in range(Time_day)] for u in range(n_user)]
+    # the MPS file gets generic row names (c0, qc0, ...) because constraint names repeat or contain spaces
+    index["constr_names"] = m.getAttr("ConstrName", m.getConstrs())
+    index["qconstr_names"] = m.getAttr("QCName", m.getQConstrs())
+    return index
+
+
+def restore_names(m, index):
+    """Gives the constraints of a model read from file the names of the freshly built model."""
+    m.setAttr("ConstrName", m.getConstrs(), index["constr_names"])
+    m.setAttr("QCName", m.getQConstrs(), index["qconstr_names"])
+    m.update()
+
+
+def restore_variables(m, index):
+    """Rebuilds the variables dict of create_model for a model read from file."""
+    m.update()
+    all_vars = m.getVars()
+    Time_day = index["Time_day"]
+    variables = {}
+    for name, (start, rows) in index["vars"].items():
+        if rows is None:
+            variables[name] = all_vars[start]
+        else:
+            variables[name] = gp.tupledict({(i, t): all_vars[start + i * Time_day + t]
+                                            for i in range(rows) for t in range(Time_day)})
+    return variables
+
+
+def data_rhs(index, model_inf, Time_day, IFRC=True):
+    """Yields (constraint position, right-hand side) for every data-dependent constraint."""
+    p_load = model_inf.p_load.tolist()
+    pv_cap = model_inf.pv_cap.tolist()
+    for t in range(Time_day):
+        yield index["congestion"][t], float(model_inf.congestion_limit[t])
+        pv_ef = pv_efficiency(model_inf, t)
+        indoor = float(indoor_rhs(model_inf, t, IFRC))
+        for u in range(model_inf.n_user):
+            yield index["load"][u][t], p_load[u][t]
+            yield index["pv"][u][t], pv_cap[u] * pv_ef
+            yield index["indoor"][u][t], indoor
+
+
+def update_model_data(m, index, model_inf, Time_day, IFRC=True):
+    """Applies the data of model_inf to the right-hand sides of a cached model."""
+    constrs = m.getConstrs()
+    positions, values = zip(*data_rhs(index, model_inf, Time_day, IFRC))
+    m.setAttr("RHS", [constrs[i] for i in positions], list(values))
+    m.update()
+
+
+def check_model_data(m, index, model_inf, Time_day, IFRC=True, tol=1e-9):
+    """Verifies that data_rhs reproduces a freshly built model, so cached models get the same data."""
+    constrs = m.getConstrs()
+    for i, value in data_rhs(index, model_inf, Time_day, IFRC):
+        if abs(constrs[i].RHS - value) > tol * max(1.0, abs(value)):
+            raise RuntimeError(f"ModelCache data update does not match constraint {constrs[i].ConstrName}: "
+                               f"{constrs[i].RHS} != {value}, update FORMAT_VERSION and data_rhs")
+
+
+def build_model_cached(Time_day, model_inf, add_opf_constraints, add_hhp_constraints, add_indoor_constraints,
+                       cache=None, env=None, callback=None, IFRC=True, tighten=True, params=None):
+    """Same as Model.build_model, but reads the model from the cache when its structure was built before."""
+    model_inf = compact_model_inf(model_inf)
+    cache = cache if cache is not None else ModelCache()
+    m, variables, _ = cache.load_or_create(Time_day, model_inf, add_opf_constraints, add_hhp_constraints,
+                                           add_indoor_constraints, env=env, IFRC=IFRC, tighten=tighten)
+    objective_parts = set_objective(m, variables, Time_day, model_inf)
+    solve_model(m, callback, params)
+    dict_optimizedResults = extract_results(variables, objective_parts, Time_day, model_inf)
+    return m, dict_optimizedResults
@@ -0,0 +1,142 @@
+# Compact, immutable model input.
+# CompactModelInf holds the same information as Parameter.ModelInf, but as contiguous float arrays
+# (users x time for the loads) together with precomputed bus<->user and bus<->line index maps, so build_model
+# does not index pandas DataFrames inside its time loop. It has no pandas objects, is cheap to pickle and
+# can be sent to worker processes.
+#
+# units follow Parameter.py: kA, kV, MW, MVA, MVar; loads are stored in MW (the raw data is in kW)
+
+import numpy as np
+
+# scalar parameters copied one-to-one from ModelInf
+SCALAR_FIELDS = (
+    "s_trafo", "pf_pv_limit", "tan_phi_pv", "pf", "tan_phi_load", "v_ref", "v_lb", "v_ub",
+    "p_hp_max", "p_hp_min", "p_boil_max", "p_boil_min", "gas_LHV", "COP",
+    "C_house", "R_house", "Pn", "PPD_Price", "StartRe", "EndRe",
+)
+
+# float arrays
+ARRAY_FIELDS = (
+    "hp_own", "x_vals", "y_vals", "ele_price", "gas_price", "solar_output", "congestion_limit", "T_amb", "Tem_ind",
+    "p_load", "q_load", "pv_factor", "pv_cap", "line_R", "line_X", "line_Inom",
+)
+
+# integer arrays describing the network
+INDEX_FIELDS = ("line_start", "line_end", "user_node")
+
+# derived from the fields above when the container is created
+DERIVED_FIELDS = ("n_bus", "n_user", "n_line", "bus_user", "bus_out_lines", "bus_in_lines")
+
+
+class CompactModelInf:
+    __slots__ = SCALAR_FIELDS + ARRAY_FIELDS + INDEX_FIELDS + DERIVED_FIELDS
+
+    def __init__(self, **fields):
+        """
+        Creates the container from keyword fields (all of SCALAR_FIELDS, ARRAY_FIELDS and INDEX_FIELDS).
+
+        p_load and q_load are (n_user, n_time) arrays in MW, pv_factor has one value per time step, pv_cap one
+        value per user in MW. line_* describe the branches (n_bus - 1 of them), user_node gives the bus of
+        every user.
+        """
+        missing = set(SCALAR_FIELDS + ARRAY_FIELDS + INDEX_FIELDS) - set(fields)
+        unknown = set(fields) - set(SCALAR_FIELDS + ARRAY_FIELDS + INDEX_FIELDS)
+        if missing or unknown:
+            raise TypeError(f"missing fields {sorted(missing)}, unknown fields {sorted(unknown)}")
+
+        for name in SCALAR_FIELDS:
+            object.__setattr__(self, name, fields[name])
+        for name in ARRAY_FIELDS:
+            object.__setattr__(self, name, _frozen(fields[name], np.float64))
+        for name in INDEX_FIELDS:
+            object.__setattr__(self, name, _frozen(fields[name], np.int64))
+
+        n_line = len(self.line_start)
+        n_bus = n_line + 1
+        n_user = len(self.user_node)
+        if self.p_load.shape[0] != n_user:
+            raise ValueError(f"p_load has {self.p_load.shape[0]} rows for {n_user} users")
+
+        # bus -> user, -1 for buses without a user
+        # as in build_model, the users are connected to the last n_user buses in order
+        bus_user = np.full(n_bus, -1, dtype=np.int64)
+        bus_user[self.user_node] = self.user_node - (n_bus - n_user)
+
+        # bus -> outgoing / incoming lines
+        bus_out_lines = tuple(tuple(np.flatnonzero(self.line_start == j).tolist()) for j in range(n_bus))
+        bus_in_lines = tuple(tuple(np.flatnonzero(self.line_end == j).tolist()) for j in range(n_bus))
+
+        object.__setattr__(self, "n_bus", n_bus)
+        object.__setattr__(self, "n_user", n_user)
+        object.__setattr__(self, "n_line", n_line)
+        object.__setattr__(self, "bus_user", _frozen(bus_user, np.int64))
+        object.__setattr__(self, "bus_out_lines", bus_out_lines)
+        object.__setattr__(self, "bus_in_lines", bus_in_lines)
+
+    @classmethod
+    def from_model_inf(cls, model_inf):
+        """Converts a Parameter.ModelInf (pandas based) into a CompactModelInf."""
+        fields = {name: getattr(model_inf, name) for name in SCALAR_FIELDS}
+        for name in ("hp_own", "x_vals", "y_vals", "ele_price", "gas_price", "solar_output",
+                     "congestion_limit", "T_amb", "Tem_ind"):
+            fields[name] = getattr(model_inf, name)
+
+        # loads: time x users in kW -> users x time in MW
+        fields["p_load"] = model_inf.LoadPower.iloc[:, 1:].to_numpy(dtype=float).T * 1E-3
+        fields["q_load"] = model_inf.LoadReact.iloc[:, 1:].to_numpy(dtype=float).T * 1E-3
+        fields["pv_factor"] = model_inf.pvFactor["Quarter_Hourly_Data"].to_numpy(dtype=float)
+        fields["pv_cap"] = model_inf.connect1["PV"].to_numpy(dtype=float) * 1E-3
+        fields["user_node"] = model_inf.connect1["Node"].to_numpy()
+
+        network = model_inf.network
+        fields["line_start"] = network["StartNode"].to_numpy()
+        fields["line_end"] = network["EndNode"].to_numpy()
+        fields["line_R"] = network["R"].to_numpy(dtype=float)
+        fields["line_X"] = network["X"].to_numpy(dtype=float)
+        fields["line_Inom"] = network["Inom"].to_numpy(dtype=float)
+        return cls(**fields)
+
+    def fields(self):
+        """Returns the input fields (without derived ones) as a dict."""
+        return {name: getattr(self, name) for name in SCALAR_FIELDS + ARRAY_FIELDS + INDEX_FIELDS}
+
+    def replace(self, **changes):
+        """Returns a copy with some fields replaced, e.g. replace(congestion_limit=limit)."""
+        fields = self.fields()
+        fields.update(changes)
+        return type(self)(**fields)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable, use replace({name}=...)")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        # only the input fields are pickled, the index maps are rebuilt on load
+        return (_unpickle, (type(self), self.fields()))
+
+    def __repr__(self):
+        return (f"{type(self).__name__}(n_bus={self.n_bus}, n_user={self.n_user}, "
+                f"n_time={self.p_load.shape[1]})")
+
+
+def _unpickle(cls, fields):
+    return cls(**fields)
+
+
+def _frozen(values, dtype):
+    # read-only arrays are shared as they are (e.g. between replace() copies), anything else is copied
+    if isinstance(values, np.ndarray) and values.dtype == dtype and values.flags.c_contiguous \
+            and not values.flags.writeable:
+        return values
+    array = np.array(values, dtype=dtype, order="C")
+    array.flags.writeable = False
+    return array
+
+
+def compact_model_inf(model_inf):
+    """Returns model_inf as a CompactModelInf, converting a Parameter.ModelInf when needed."""
+    if isinstance(model_inf, CompactModelInf):
+        return model_inf
+    return CompactModelInf.from_model_inf(model_inf)
@@ -0,0 +1,208 @@
+# Multi-feeder execution.
+# Every directory below the data root with a network.csv and a user_connect.xlsx is one LV feeder. The common
+# data of Parameter.py (prices, weather, device parameters) is shared, the network, users and loads are taken
+# per feeder. All feeders are solved concurrently in one process: the largest feeders are started first and
+# the available cores are divided over the solves in proportion to feeder size. A common deadline bounds the
+# total wall time, also when the feeders run in several waves. Results are aggregated at the substation level.
+#
+# run from the repository root:  python -m src.MultiFeeder --root data --threads 8 --time-limit 600 --deadline 900
+
+import argparse
+import concurrent.futures
+import os
+import time
+
+import gurobipy as gp
+import numpy as np
+import pandas as pd
+from gurobipy import GRB
+
+from src.Model import create_model, extract_results, set_objective, solve_model
+from src.ModelData import compact_model_inf
+from src.OpfModel import add_opf_constraints
+from src.HHPmodel import add_hhp_constraints
+from src.ThermalModel import add_indoor_constraints
+
+
+def discover_feeders(root="data"):
+    """Returns {feeder name: directory} for every directory below root holding network.csv and user_connect.xlsx."""
+    feeders = {}
+    for directory, _, files in os.walk(root):
+        if "network.csv" in files and "user_connect.xlsx" in files:
+            name = os.path.relpath(directory, root)
+            feeders[os.path.basename(os.path.normpath(root)) if name == "." else name] = directory
+    return dict(sorted(feeders.items()))
+
+
+def load_feeder(feeder_dir, base_model_inf, load_file="data/user_load.csv"):
+    """
+    Returns the CompactModelInf of one feeder.
+
+    Network and users come from feeder_dir; the base load of every user is the column of its user number
+    (first column of user_connect.xlsx) in feeder_dir/user_load.csv, or in load_file when the feeder has no
+    load file of its own. All other data is taken from base_model_inf.
+    """
+    base_model_inf = compact_model_inf(base_model_inf)
+    network = pd.read_csv(os.path.join(feeder_dir, "network.csv"))
+    connect = pd.read_excel(os.path.join(feeder_dir, "user_connect.xlsx"))
+    feeder_load_file = os.path.join(feeder_dir, "user_load.csv")
+    load = pd.read_csv(feeder_load_file if os.path.exists(feeder_load_file) else load_file)
+
+    user_ids = connect.iloc[:, 0].astype(str).tolist()
+    missing = [user for user in user_ids if user not in load.columns]
+    if missing:
+        raise ValueError(f"{feeder_dir}: no load data for users {missing}")
+    p_load = load[user_ids].to_numpy(dtype=float).T * 1E-3
+    return base_model_inf.replace(
+        line_start=network["StartNode"].to_numpy(),
+        line_end=network["EndNode"].to_numpy(),
+        line_R=network["R"].to_numpy(dtype=float),
+        line_X=network["X"].to_numpy(dtype=float),
+        line_Inom=network["Inom"].to_numpy(dtype=float),
+        user_node=connect["Node"].to_numpy(),
+        hp_own=connect["HP"].to_numpy(dtype=float),
+        pv_cap=connect["PV"].to_numpy(dtype=float) * 1E-3,
+        p_load=p_load,
+        # reactive base load is not used by the LoadQ constraint, keep it consistent with the load power factor
+        q_load=p_load * base_model_inf.tan_phi_load,
+    )
+
+
+def feeder_size(model_inf):
+    # rough measure of solve effort: buses (OPF rows) plus users (binaries) per time step
+    return model_inf.n_bus + 2 * model_inf.n_user
+
+
+def allocate_threads(sizes, total_threads):
+    """
+    Returns (workers, threads): the number of concurrent solves and the Threads parameter per feeder.
+
+    With more feeders than cores every solve gets one thread. Otherwise all feeders run at once and the cores
+    are divided in proportion to size (largest remainder, at least one thread each, never more than
+    total_threads in total).
+    """
+    if len(sizes) >= total_threads:
+        return total_threads, [1] * len(sizes)
+    share = np.asarray(sizes, dtype=float) / sum(sizes) * total_threads
+    threads = np.maximum(np.floor(share).astype(int), 1)
+    # the minimum of one thread can exceed the cores, take the excess from the largest feeders
+    for i in np.argsort(-share, kind="stable"):
+        while threads.sum() > total_threads and threads[i] > 1:
+            threads[i] -= 1
+    for i in np.argsort(threads - share):
+        if threads.sum() >= total_threads:
+            break
+        threads[i] += 1
+    return len(sizes), threads.tolist()
+
+
+def _solve_feeder(name, model_inf, Time_day, threads, params, end=None):
+    # end: time.monotonic() value by which all feeders have to be solved, None for no common deadline
+    start = time.monotonic()
+    if end is not None and start >= end:
+        raise RuntimeError("deadline reached before the solve started")
+    with gp.Env(params={"LogToConsole": 0}) as env:
+        solve_params = dict(params or {})
+        solve_params["Threads"] = threads
+        solve_params.setdefault("LogFile", f"GEC_{name.replace(os.sep, '_')}.log")
+        m, variables = create_model(Time_day, model_inf, add_opf_constraints, add_hhp_constraints,
+                                    add_indoor_constraints, env=env)
+        objective_parts = set_objective(m, variables, Time_day, model_inf)
+
+        deadline_limited = False
+        if end is not None:
+            # the solve gets the time left after the build, capped by the per-solve TimeLimit
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                m.dispose()
+                raise RuntimeError("deadline reached while building the model")
+            if remaining < solve_params.get("TimeLimit", float("inf")):
+                solve_params["TimeLimit"] = remaining
+                deadline_limited = True
+        solve_model(m, params=solve_params)
+        if m.SolCount == 0:
+            status = m.Status
+            m.dispose()
+            if deadline_limited and status == GRB.TIME_LIMIT:
+                raise RuntimeError("no solution found before the deadline")
+            raise RuntimeError(f"no feasible solution found (model status {status})")
+
+        dict_optimizedResults = extract_results(variables, objective_parts, Time_day, model_inf)
+        dict_optimizedResults["objective"] = m.ObjVal
+        dict_optimizedResults["model_status"] = m.Status
+        dict_optimizedResults["runtime"] = m.Runtime
+        dict_optimizedResults["threads"] = threads
+        # True when the incumbent is returned because the common deadline stopped the solve
+        dict_optimizedResults["deadline_hit"] = deadline_limited and m.Status == GRB.TIME_LIMIT
+        m.dispose()
+    dict_optimizedResults["wall_time"] = time.monotonic() - start
+    return dict_optimizedResults
+
+
+def solve_feeders(feeders, Time_day=96, total_threads=None, params=None, deadline=None):
+    """
+    Solves all feeders concurrently, largest first.
+
+    :param feeders:       {name: ModelInf or CompactModelInf}
+    :param Time_day:      Number of time steps
+    :param total_threads: Cores to use (defaults to os.cpu_count())
+    :param params:        Gurobi parameters for every solve, e.g. {"TimeLimit": 600}
+    :param deadline:      Seconds from now by which all feeders have to be finished, e.g. 900 for the 15 min
+                          dispatch window. Every solve gets at most the time left when its build is done; a
+                          feeder stopped by the deadline returns its incumbent (deadline_hit True) or fails.
+    :return:              {name: dict_optimizedResults}, feeders that failed map to {"error": message}
+    """
+    end = time.monotonic() + deadline if deadline is not None else None
+    feeders = {name: compact_model_inf(model_inf) for name, model_inf in feeders.items()}
+    order = sorted(feeders, key=lambda name: feeder_size(feeders[name]), reverse=True)
+    workers, threads = allocate_threads([feeder_size(feeders[name]) for name in order],
+                                        total_threads or os.cpu_count() or 1)
+
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        # the pool starts jobs in submission order, so the largest feeders are scheduled first
+        futures = {pool.submit(_solve_feeder, name, feeders[name], Time_day, n, params, end): name
+                   for name, n in zip(order, threads)}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as exc:
+                results[futures[future]] = {"error": str(exc)}
+    return {name: results[name] for name in sorted(results)}
+
+
+def aggregate_substation(results):
+    """Sums the transformer power (bus 0) and the cost components of all solved feeders."""
+    solved = {name: result for name, result in results.items() if "error" not in result}
+    total = {
+        "p": np.sum([result["p"][0] for result in solved.values()], axis=0).tolist() if solved else [],
+        "q": np.sum([result["q"][0] for result in solved.values()], axis=0).tolist() if solved else [],
+        "failed": sorted(set(results) - set(solved)),
+        "deadline_hit": sorted(name for name, result in solved.items() if result.get("deadline_hit")),
+        "wall_time": max((result["wall_time"] for result in solved.values()), default=0.0),
+    }
+    for key in ("power_cost", "gas_cost", "PPD_cost", "objective"):
+        total[key] = sum(result[key] for result in solved.values())
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve all LV feeders below a data directory concurrently")
+    parser.add_argument("--root", default="data")
+    parser.add_argument("--time-day", type=int, default=96)
+    parser.add_argument("--threads", type=int, default=None, help="cores to use (default: all)")
+    parser.add_argument("--time-limit", type=float, default=600, help="gurobi TimeLimit of every solve")
+    parser.add_argument("--deadline", type=float, default=900, help="seconds by which all feeders have to be solved")
+    args = parser.parse_args()
+
+    from src.Parameter import get_model_inf
+    base_model_inf = compact_model_inf(get_model_inf())
+    feeders = {name: load_feeder(directory, base_model_inf) for name, directory in discover_feeders(args.root).items()}
+    results = solve_feeders(feeders, args.time_day, args.threads, params={"TimeLimit": args.time_limit},
+                            deadline=args.deadline)
+    for name, result in results.items():
+        print(name, result.get("error") or f"objective {result['objective']:.4f}, {result['wall_time']:.1f} s, "
+                                           f"{result['threads']} threads")
+    substation = aggregate_substation(results)
+    print(f"substation: objective {substation['objective']:.4f}, peak import {-min(substation['p'], default=0):.4f} MW, "
+          f"failed {substation['failed']}, stopped by the deadline {substation['deadline_hit']}")
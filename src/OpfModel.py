@@ -1,28 +1,28 @@
+from gurobipy import quicksum
+
+
 def add_opf_constraints(m, PLine, QLine, l, v, p, q, model_inf, n_bus, t,slack_pos,slack_neg,slack_vol_pos,slack_vol_neg,slack_line,powerlimit):
     # Slack bus constraints
     m.addConstr(p[0, t] >= model_inf.congestion_limit[t], f"TransPowerLimitForCongestion{t}")
     m.addQConstr(p[0, t] * p[0, t] + q[0, t] * q[0, t] <= model_inf.s_trafo**2, f"trafoLimit{t}")
     # if t >=67 and t <= 75:
     #     m.addConstr(p[0, t] >= -powerlimit, f"test_limit{t}")
+
+    # line data and bus -> line maps from CompactModelInf
+    start, end = model_inf.line_start.tolist(), model_inf.line_end.tolist()
+    R, X, Inom = model_inf.line_R.tolist(), model_inf.line_X.tolist(), model_inf.line_Inom.tolist()
+
     # Non-slack bus power balance
     for j in range(n_bus):
-        P_outFlow, P_inFlow, P_loss = 0, 0, 0
-        for i in range(n_bus - 1):
-            if model_inf.network.at[i, 'StartNode'] == j:
-                P_outFlow += PLine[i, t]
-            if model_inf.network.at[i, 'EndNode'] == j:
-                P_inFlow += PLine[i, t]
-                P_loss += l[i, t] * model_inf.network.at[i, 'R']
+        P_outFlow = quicksum(PLine[i, t] for i in model_inf.bus_out_lines[j])
+        P_inFlow = quicksum(PLine[i, t] for i in model_inf.bus_in_lines[j])
+        P_loss = quicksum(l[i, t] * R[i] for i in model_inf.bus_in_lines[j])
         m.addConstr(p[j, t]  == -P_outFlow + (P_inFlow - P_loss), name=f"BusPower{j,t}")
 
     for j in range(n_bus):
-        Q_outFlow, Q_inFlow, Q_loss = 0, 0, 0
-        for i in range(n_bus - 1):
-            if model_inf.network.at[i, 'StartNode'] == j:
-                Q_outFlow += QLine[i, t]
-            if model_inf.network.at[i, 'EndNode'] == j:
-                Q_inFlow += QLine[i, t]
-                Q_loss += l[i, t] * model_inf.network.at[i, 'X']
+        Q_outFlow = quicksum(QLine[i, t] for i in model_inf.bus_out_lines[j])
+        Q_inFlow = quicksum(QLine[i, t] for i in model_inf.bus_in_lines[j])
+        Q_loss = quicksum(l[i, t] * X[i] for i in model_inf.bus_in_lines[j])
         m.addConstr(q[j, t] == -Q_outFlow + (Q_inFlow - Q_loss), name=f"BusReact{j,t}")
 
     # Voltage relation
@@ -31,23 +31,23 @@ def add_opf_constraints(m, PLine, QLine, l, v, p, q, model_inf, n_bus, t,slack_p
     #     m.addConstr(v[i, t] <= (model_inf.v_ub*model_inf.v_ref)**2 + slack_vol_pos[i,t], name=f"VoltageUpperBound{i,t}")
     for i in range(n_bus - 1):
         m.addConstr(
-            v[model_inf.network.at[i, 'EndNode'], t] == v[model_inf.network.at[i, 'StartNode'], t]
-            - 2 * ((model_inf.network.at[i, 'R']) * PLine[i, t] + (model_inf.network.at[i, 'X']) * QLine[i, t])
-            + ((model_inf.network.at[i, 'R'])**2 + (model_inf.network.at[i, 'X']**2)) * l[i, t],
+            v[end[i], t] == v[start[i], t]
+            - 2 * (R[i] * PLine[i, t] + X[i] * QLine[i, t])
+            + (R[i]**2 + X[i]**2) * l[i, t],
             name=f"LineVoltage{i,t}"
         )
 
     # Second-order cone constraint
     for i in range(n_bus - 1):
         m.addQConstr(
-            PLine[i, t] * PLine[i, t] + QLine[i, t] * QLine[i, t] <= l[i, t] * v[model_inf.network.at[i, 'StartNode'], t],
+            PLine[i, t] * PLine[i, t] + QLine[i, t] * QLine[i, t] <= l[i, t] * v[start[i], t],
             name=f"BusSOCP{i,t}"
         )
 
     # Line current constraint
     for i in range(n_bus - 1):
-        m.addConstr(l[i, t] <= (model_inf.network.at[i, 'Inom'])**2 *1.5 , name=f"LineCurrent{i,t}")
-        # m.addConstr(l[i, t] <= (model_inf.network.at[i, 'Inom'])**2 +slack_line[i,t], name=f"LineCurrent{i,t}")
+        m.addConstr(l[i, t] <= Inom[i]**2 *1.5 , name=f"LineCurrent{i,t}")
+        # m.addConstr(l[i, t] <= Inom[i]**2 +slack_line[i,t], name=f"LineCurrent{i,t}")
 
     # Slack bus voltage constraint
     m.addConstr(v[0, t] == model_inf.v_ref**2, f"transVol{t}")
\ No newline at end of file
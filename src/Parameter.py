@@ -115,8 +115,24 @@ class ModelInf:
 
 
 
-def get_model_inf():
-    return ModelInf()
+def get_model_inf(date=None, congestion_limit=None):
+    """
+    Returns the model input, optionally overriding the scenario-specific fields.
+
+    :param date:             Day whose hourly prices are used, e.g. "2024-02-01" (defaults to 2024-02-01)
+    :param congestion_limit: Transformer power limit per time step in MW (defaults to the built-in profile)
+    """
+    model_inf = ModelInf()
+    if date is not None:
+        day = pd.Timestamp(date)
+        prices = price_data.query(f"year == {day.year} & month == {day.month} & day == {day.day}")
+        if prices.empty:
+            raise ValueError(f"No price data for {day.date()}")
+        model_inf.ele_price = prices['energy_price_full'].values
+        model_inf.gas_price = prices['gas_price_full'].values
+    if congestion_limit is not None:
+        model_inf.congestion_limit = np.asarray(congestion_limit, dtype=float)
+    return model_inf
 
 
 
@@ -0,0 +1,209 @@
+# Golden-output regression harness with performance budgets.
+# Runs the model on fixed instances (the TestCase feeder with a 3 step and a full horizon, the real feeder with
+# a reduced horizon) and compares the objective components and key trajectories against references stored in
+# data/golden/. Build time, solve time and memory are checked against budgets stored with the references, so
+# performance regressions in OpfModel / HHPmodel / ThermalModel fail the same way as result changes.
+#
+# run from the repository root:
+#   python -m src.Regression                            compare all instances that have a reference
+#   python -m src.Regression --update                   (re)record the references and budgets
+#   python -m src.Regression --instance testcase_short  only the instance for the size-limited gurobi license
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import gurobipy as gp
+import numpy as np
+from gurobipy import GRB
+
+from src.Model import create_model, extract_results, set_objective, solve_model
+from src.ModelData import compact_model_inf
+from src.MultiFeeder import load_feeder
+from src.OpfModel import add_opf_constraints
+from src.HHPmodel import add_hhp_constraints
+from src.ThermalModel import add_indoor_constraints
+
+GOLDEN_DIR = "data/golden"
+
+INSTANCES = {
+    # small enough for the size-limited gurobi license, so the comparison runs on every machine
+    "testcase_short": {"feeder": "data/TestCase", "Time_day": 3},
+    # full-size instances, need a full gurobi license
+    "testcase": {"feeder": "data/TestCase", "Time_day": 96},
+    "real_reduced": {"feeder": "data", "Time_day": 24},
+}
+
+# deterministic and tight solves, so differences come from the model and not from the 5% MIPGap of solve_model
+SOLVE_PARAMS = {"Threads": 1, "Seed": 0, "MIPGap": 1e-4, "LogFile": ""}
+
+COST_KEYS = ("power_cost", "gas_cost", "PPD_cost")
+
+TOLERANCES = {
+    "cost_rtol": 1e-3,
+    "cost_atol": 1e-6,
+    # absolute tolerance per time step
+    "trajectories": {"transformer_p": 1e-4, "T_ind_mean": 0.05, "PPD_total": 0.5},
+}
+
+PERFORMANCE_KEYS = ("build_time", "solve_time", "build_memory_mb", "solver_memory_mb")
+
+
+def _build(Time_day, model_inf):
+    m, variables = create_model(Time_day, model_inf, add_opf_constraints, add_hhp_constraints, add_indoor_constraints)
+    objective_parts = set_objective(m, variables, Time_day, model_inf)
+    m.update()
+    return m, variables, objective_parts
+
+
+def run_instance(name, base_model_inf):
+    """Builds and solves one instance and returns its measurements."""
+    spec = INSTANCES[name]
+    model_inf = load_feeder(spec["feeder"], base_model_inf)
+    Time_day = spec["Time_day"]
+
+    # memory and time of the build are measured in separate passes, tracemalloc slows down every allocation
+    tracemalloc.start()
+    m, _, _ = _build(Time_day, model_inf)
+    _, build_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    m.dispose()
+
+    start = time.perf_counter()
+    m, variables, objective_parts = _build(Time_day, model_inf)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    solve_model(m, params=SOLVE_PARAMS)
+    solve_time = time.perf_counter() - start
+    if m.Status != GRB.OPTIMAL:
+        raise RuntimeError(f"{name}: model status {m.Status}, expected optimal")
+
+    results = extract_results(variables, objective_parts, Time_day, model_inf)
+    try:
+        solver_memory_mb = m.MaxMemUsed * 1024  # GB
+    except (AttributeError, gp.GurobiError):
+        solver_memory_mb = None
+    measured = {
+        "objective": m.ObjVal,
+        "costs": {key: results[key] for key in COST_KEYS},
+        "trajectories": {
+            "transformer_p": results["p"][0],
+            "T_ind_mean": np.mean(results["T_ind"], axis=0).tolist(),
+            "PPD_total": np.sum(results["PPD"], axis=0).tolist(),
+        },
+        "performance": {
+            "build_time": build_time,
+            "solve_time": solve_time,
+            "build_memory_mb": build_peak / 2**20,
+            "solver_memory_mb": solver_memory_mb,
+        },
+    }
+    m.dispose()
+    return measured
+
+
+def compare(measured, reference):
+    """Returns a list of failure messages (empty when the instance passes)."""
+    failures = []
+    for key in COST_KEYS:
+        value, expected = measured["costs"][key], reference["costs"][key]
+        if not np.isclose(value, expected, rtol=TOLERANCES["cost_rtol"], atol=TOLERANCES["cost_atol"]):
+            failures.append(f"{key} = {value:.6g}, reference {expected:.6g}")
+
+    for key, atol in TOLERANCES["trajectories"].items():
+        value = np.asarray(measured["trajectories"][key])
+        expected = np.asarray(reference["trajectories"][key])
+        if value.shape != expected.shape:
+            failures.append(f"{key} has shape {value.shape}, reference {expected.shape}")
+            continue
+        error = np.abs(value - expected)
+        if error.max(initial=0.0) > atol:
+            t = int(error.argmax())
+            failures.append(f"{key}[{t}] = {value[t]:.6g}, reference {expected[t]:.6g} (atol {atol})")
+
+    for key in PERFORMANCE_KEYS:
+        value, budget = measured["performance"][key], reference["budgets"].get(key)
+        if value is not None and budget is not None and value > budget:
+            failures.append(f"{key} = {value:.3g} over budget {budget:.3g}")
+    return failures
+
+
+def make_reference(measured, budget_factor=1.5, time_slack=0.01, memory_slack_mb=0.05):
+    """
+    Reference record with budgets of budget_factor times the measured performance.
+
+    time_slack / memory_slack_mb are the least headroom of a budget, so timer noise on very short measurements
+    does not fail the comparison; they only matter for measurements below slack / (budget_factor - 1).
+    """
+    reference = {key: measured[key] for key in ("objective", "costs", "trajectories")}
+    reference["measured"] = measured["performance"]
+    reference["budgets"] = {}
+    for key, value in measured["performance"].items():
+        if value is not None:
+            slack = time_slack if key.endswith("_time") else memory_slack_mb
+            reference["budgets"][key] = max(value * budget_factor, value + slack)
+    return reference
+
+
+def golden_path(name):
+    return os.path.join(GOLDEN_DIR, f"{name}.json")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Golden-output regression harness with performance budgets")
+    parser.add_argument("--instance", action="append", choices=sorted(INSTANCES),
+                        help="default: all instances with a reference (all instances with --update)")
+    parser.add_argument("--update", action="store_true", help="record new references and budgets")
+    parser.add_argument("--budget-factor", type=float, default=1.5)
+    args = parser.parse_args(argv)
+
+    from src.Parameter import get_model_inf
+    base_model_inf = compact_model_inf(get_model_inf())
+
+    names = args.instance or sorted(INSTANCES)
+    if not args.instance and not args.update:
+        # instances without a reference (e.g. the full-size ones on a machine without a full gurobi license) are
+        # skipped; asking for one with --instance fails instead
+        for name in names:
+            if not os.path.exists(golden_path(name)):
+                print(f"SKIP {name}: no reference {golden_path(name)}, run with --update --instance {name}")
+        names = [name for name in names if os.path.exists(golden_path(name))]
+
+    failed = False
+    for name in names:
+        try:
+            measured = run_instance(name, base_model_inf)
+        except Exception as exc:
+            print(f"FAIL {name}: {exc}")
+            failed = True
+            continue
+        performance = ", ".join(f"{key} {value:.3g}" for key, value in measured["performance"].items()
+                                if value is not None)
+
+        if args.update:
+            os.makedirs(GOLDEN_DIR, exist_ok=True)
+            with open(golden_path(name), "w") as f:
+                json.dump(make_reference(measured, args.budget_factor), f, indent=1)
+            print(f"RECORDED {name}: objective {measured['objective']:.6g}, {performance}")
+            continue
+
+        if not os.path.exists(golden_path(name)):
+            print(f"FAIL {name}: no reference {golden_path(name)}, run with --update")
+            failed = True
+            continue
+        with open(golden_path(name)) as f:
+            failures = compare(measured, json.load(f))
+        if failures:
+            failed = True
+            print(f"FAIL {name}: " + "; ".join(failures))
+        else:
+            print(f"PASS {name}: objective {measured['objective']:.6g}, {performance}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
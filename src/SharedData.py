@@ -0,0 +1,140 @@
+# Shared-memory broadcast of the model input for multi-process scenario runs.
+# The parent process loads the data once (Parameter.py) and copies every array of the CompactModelInf into a
+# shared memory block. Worker processes attach to these blocks zero-copy through a small picklable handle and
+# only replace the scenario-specific fields (congestion limit, prices), so memory stays flat with the number
+# of workers. Workers never import Parameter.py themselves.
+
+import concurrent.futures
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from src.ModelData import ARRAY_FIELDS, INDEX_FIELDS, SCALAR_FIELDS, CompactModelInf, compact_model_inf
+
+# shared memory blocks attached by this process, kept alive as long as the arrays viewing them
+_attached = {}
+
+# model input of a scenario worker process, set by _init_worker
+_worker_model_inf = None
+
+
+class SharedModelInf:
+    def __init__(self, model_inf):
+        """
+        Copies the arrays of model_inf into shared memory. The creating process owns the blocks and must call
+        close() (or use the object as a context manager) once all workers are done.
+
+        :param model_inf: Parameter.ModelInf or CompactModelInf
+        """
+        model_inf = compact_model_inf(model_inf)
+        self._blocks = []
+        arrays = {}
+        for name in ARRAY_FIELDS + INDEX_FIELDS:
+            value = getattr(model_inf, name)
+            block = shared_memory.SharedMemory(create=True, size=max(value.nbytes, 1))
+            np.ndarray(value.shape, dtype=value.dtype, buffer=block.buf)[...] = value
+            self._blocks.append(block)
+            arrays[name] = (block.name, value.shape, value.dtype.str)
+        self.handle = {"scalars": {name: getattr(model_inf, name) for name in SCALAR_FIELDS}, "arrays": arrays}
+
+    def nbytes(self):
+        return sum(block.size for block in self._blocks)
+
+    def close(self):
+        """Releases and removes the shared memory blocks."""
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _open_block(name):
+    if name not in _attached:
+        try:
+            # python >= 3.13: the owner is responsible for unlinking, not the resource tracker of this process
+            _attached[name] = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            _attached[name] = shared_memory.SharedMemory(name=name)
+    return _attached[name]
+
+
+def attach_model_inf(handle, **overrides):
+    """
+    Returns a CompactModelInf whose arrays are read-only views on the shared memory of handle.
+
+    :param handle:    SharedModelInf.handle of the parent process
+    :param overrides: Scenario-specific fields, e.g. congestion_limit=..., ele_price=...
+    """
+    fields = dict(handle["scalars"])
+    for name, (block_name, shape, dtype) in handle["arrays"].items():
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=_open_block(block_name).buf)
+        array.flags.writeable = False
+        fields[name] = array
+    fields.update(overrides)
+    return CompactModelInf(**fields)
+
+
+def _init_worker(handle):
+    global _worker_model_inf
+    _worker_model_inf = attach_model_inf(handle)
+
+
+def _solve_scenario(Time_day, overrides, threads, index):
+    import gurobipy as gp
+    from src.Model import create_model, extract_results, set_objective, solve_model
+    from src.OpfModel import add_opf_constraints
+    from src.HHPmodel import add_hhp_constraints
+    from src.ThermalModel import add_indoor_constraints
+
+    # replace() keeps sharing every array that is not overridden
+    model_inf = _worker_model_inf.replace(**overrides)
+    with gp.Env(params={"LogToConsole": 0, "Threads": threads}) as env:
+        m, variables = create_model(Time_day, model_inf, add_opf_constraints, add_hhp_constraints,
+                                    add_indoor_constraints, env=env)
+        objective_parts = set_objective(m, variables, Time_day, model_inf)
+        solve_model(m, params={"LogFile": f"GEC_scenario{index}.log"})
+        if m.SolCount == 0:
+            status = m.Status
+            m.dispose()
+            raise RuntimeError(f"no feasible solution found (model status {status})")
+        dict_optimizedResults = extract_results(variables, objective_parts, Time_day, model_inf)
+        dict_optimizedResults["objective"] = m.ObjVal
+        dict_optimizedResults["model_status"] = m.Status
+        dict_optimizedResults["runtime"] = m.Runtime
+        m.dispose()
+    return dict_optimizedResults
+
+
+def run_scenarios(model_inf, scenarios, Time_day=96, processes=None, threads_per_solve=1):
+    """
+    Solves build_model for several scenarios in a process pool that shares one copy of the input data.
+
+    :param model_inf:         Parameter.ModelInf or CompactModelInf with the common data
+    :param scenarios:         List of dicts with the fields to override per scenario, e.g. {"congestion_limit": [...]}
+    :param Time_day:          Number of time steps
+    :param processes:         Number of worker processes (defaults to cpu_count // threads_per_solve)
+    :param threads_per_solve: Gurobi Threads parameter of every solve
+    :return:                  List of dict_optimizedResults in the order of scenarios, scenarios that failed
+                              (e.g. infeasible) give {"error": message}
+    """
+    if processes is None:
+        processes = max(1, (os.cpu_count() or 1) // threads_per_solve)
+    with SharedModelInf(model_inf) as shared:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                                    initargs=(shared.handle,)) as pool:
+            futures = [pool.submit(_solve_scenario, Time_day, overrides, threads_per_solve, i)
+                       for i, overrides in enumerate(scenarios)]
+            results = []
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as exc:
+                    results.append({"error": str(exc)})
+            return results
@@ -0,0 +1,198 @@
+# Progress streaming and early termination for the model solve.
+# build_model blocks in m.optimize() for up to TimeLimit seconds. stream_solve (generator) and astream_solve
+# (async iterator) run the same create_model -> set_objective -> solve_model -> extract_results stages in a
+# background thread and yield events while they run:
+#   {"event": "build_start"} / {"event": "build_end", "build_time": ...}
+#   {"event": "solve_start"}
+#   {"event": "incumbent", "objective", "bound", "gap", "solutions", "runtime", optionally "solution"}
+#   {"event": "progress", "objective", "bound", "gap", "nodes", "runtime"}   (every `interval` seconds)
+#   {"event": "stop", "reason"}   when an early termination rule fired
+#   {"event": "solve_end", "status", "objective", "bound", "gap", "runtime"}
+#   {"event": "result", "results": dict_optimizedResults}   or   {"event": "error", "error": message}
+# Early termination: stop once the gap is below `gap`, or when the incumbent has not improved for `stall`
+# seconds, so a good-enough schedule can be used as soon as it exists.
+
+import asyncio
+import queue
+import threading
+import time
+
+from gurobipy import GRB
+
+from src.Model import create_model, extract_results, set_objective, solve_model
+from src.ModelData import compact_model_inf
+
+_DONE = object()
+
+
+def relative_gap(objective, bound):
+    # same definition as the gurobi MIPGap
+    if objective is None or abs(objective) >= GRB.INFINITY:
+        return float("inf")
+    return abs(objective - bound) / max(abs(objective), 1e-10)
+
+
+class ProgressCallback:
+    def __init__(self, emit, gap=None, stall=None, interval=1.0, cancel_event=None, variables=None,
+                 solution_groups=()):
+        """
+        Gurobi callback that reports progress and applies early termination rules.
+
+        :param emit:            Function called with every event dict
+        :param gap:             Stop when the relative gap is at or below this value
+        :param stall:           Stop when the incumbent has not improved for this many seconds
+        :param interval:        Seconds between "progress" events
+        :param cancel_event:    threading.Event, the solve stops when it is set
+        :param variables:       Variables dict of create_model, needed for solution_groups
+        :param solution_groups: Names of variable groups whose incumbent values are added to incumbent events
+        """
+        self.emit = emit
+        self.gap = gap
+        self.stall = stall
+        self.interval = interval
+        self.cancel_event = cancel_event
+        self.variables = variables
+        self.solution_groups = solution_groups
+        self.best = None
+        self.last_improvement = 0.0
+        self.last_progress = None
+        self.stop_reason = None
+
+    def _stop(self, model, reason):
+        if self.stop_reason is None:
+            self.stop_reason = reason
+            self.emit({"event": "stop", "reason": reason})
+            model.terminate()
+
+    def _check_rules(self, model, bound, runtime):
+        if self.best is not None and self.gap is not None and relative_gap(self.best, bound) <= self.gap:
+            self._stop(model, f"gap below {self.gap}")
+        elif self.best is not None and self.stall is not None and runtime - self.last_improvement >= self.stall:
+            self._stop(model, f"no improvement for {self.stall} s")
+
+    def __call__(self, model, where):
+        # checked in every callback, so a cancel also stops presolve and the root relaxation
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            self._stop(model, "cancelled")
+            return
+        if where == GRB.Callback.MIPSOL:
+            objective = model.cbGet(GRB.Callback.MIPSOL_OBJ)
+            bound = model.cbGet(GRB.Callback.MIPSOL_OBJBND)
+            runtime = model.cbGet(GRB.Callback.RUNTIME)
+            if self.best is None or objective < self.best:
+                self.best = objective
+                self.last_improvement = runtime
+            # MIPSOL_SOLCNT counts the solutions found before this one
+            event = {"event": "incumbent", "objective": objective, "bound": bound,
+                     "gap": relative_gap(objective, bound), "solutions": model.cbGet(GRB.Callback.MIPSOL_SOLCNT) + 1,
+                     "runtime": runtime}
+            if self.solution_groups:
+                event["solution"] = {}
+                for name in self.solution_groups:
+                    group = self.variables[name]
+                    keys = list(group.keys())
+                    values = model.cbGetSolution([group[key] for key in keys])
+                    event["solution"][name] = dict(zip(keys, values))
+            self.emit(event)
+            self._check_rules(model, bound, runtime)
+        elif where == GRB.Callback.MIP:
+            runtime = model.cbGet(GRB.Callback.RUNTIME)
+            bound = model.cbGet(GRB.Callback.MIP_OBJBND)
+            if self.last_progress is None or runtime - self.last_progress >= self.interval:
+                self.last_progress = runtime
+                objective = model.cbGet(GRB.Callback.MIP_OBJBST)
+                self.emit({"event": "progress", "objective": objective if objective < GRB.INFINITY else None,
+                           "bound": bound, "gap": relative_gap(objective, bound),
+                           "nodes": model.cbGet(GRB.Callback.MIP_NODCNT), "runtime": runtime})
+            self._check_rules(model, bound, runtime)
+
+
+def run_with_progress(emit, Time_day, model_inf, add_opf_constraints, add_hhp_constraints, add_indoor_constraints,
+                      gap=None, stall=None, interval=1.0, cancel_event=None, solution_groups=(), env=None,
+                      params=None, tighten=True):
+    """Runs the build and solve stages, reporting every phase through emit. Returns (m, dict_optimizedResults)."""
+    model_inf = compact_model_inf(model_inf)
+    emit({"event": "build_start"})
+    start = time.monotonic()
+    m, variables = create_model(Time_day, model_inf, add_opf_constraints, add_hhp_constraints,
+                                add_indoor_constraints, env=env, tighten=tighten)
+    objective_parts = set_objective(m, variables, Time_day, model_inf)
+    emit({"event": "build_end", "build_time": time.monotonic() - start})
+    if cancel_event is not None and cancel_event.is_set():
+        emit({"event": "stop", "reason": "cancelled"})
+        return m, None
+
+    callback = ProgressCallback(emit, gap=gap, stall=stall, interval=interval, cancel_event=cancel_event,
+                                variables=variables, solution_groups=solution_groups)
+    emit({"event": "solve_start"})
+    solve_model(m, callback, params)
+    emit({"event": "solve_end", "status": m.Status, "objective": m.ObjVal if m.SolCount else None,
+          "bound": m.ObjBound, "gap": m.MIPGap if m.SolCount else float("inf"), "runtime": m.Runtime,
+          "stop_reason": callback.stop_reason})
+    dict_optimizedResults = extract_results(variables, objective_parts, Time_day, model_inf) if m.SolCount else None
+    return m, dict_optimizedResults
+
+
+def _produce(emit, cancel_event, args, kwargs):
+    try:
+        _, dict_optimizedResults = run_with_progress(emit, *args, cancel_event=cancel_event, **kwargs)
+        if dict_optimizedResults is None:
+            emit({"event": "error", "error": "cancelled before a solution was found" if cancel_event.is_set()
+                  else "no feasible solution found"})
+        else:
+            emit({"event": "result", "results": dict_optimizedResults})
+    except Exception as exc:
+        emit({"event": "error", "error": str(exc)})
+
+
+def stream_solve(Time_day, model_inf, add_opf_constraints, add_hhp_constraints, add_indoor_constraints, **kwargs):
+    """
+    Generator of progress events, see the top of this file. Takes the arguments of run_with_progress
+    (gap, stall, interval, solution_groups, env, params, tighten). Closing the generator early stops the solve.
+    """
+    events = queue.Queue()
+    cancel_event = threading.Event()
+    args = (Time_day, model_inf, add_opf_constraints, add_hhp_constraints, add_indoor_constraints)
+
+    def produce():
+        _produce(events.put, cancel_event, args, kwargs)
+        events.put(_DONE)
+
+    worker = threading.Thread(target=produce, daemon=True)
+    worker.start()
+    try:
+        while True:
+            event = events.get()
+            if event is _DONE:
+                return
+            yield event
+    finally:
+        cancel_event.set()
+        worker.join()
+
+
+async def astream_solve(Time_day, model_inf, add_opf_constraints, add_hhp_constraints, add_indoor_constraints,
+                        **kwargs):
+    """Async iterator version of stream_solve; the solve runs in a background thread."""
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    cancel_event = threading.Event()
+    args = (Time_day, model_inf, add_opf_constraints, add_hhp_constraints, add_indoor_constraints)
+
+    def emit(event):
+        loop.call_soon_threadsafe(events.put_nowait, event)
+
+    def produce():
+        _produce(emit, cancel_event, args, kwargs)
+        emit(_DONE)
+
+    worker = loop.run_in_executor(None, produce)
+    try:
+        while True:
+            event = await events.get()
+            if event is _DONE:
+                return
+            yield event
+    finally:
+        cancel_event.set()
+        await asyncio.shield(worker)
@@ -61,21 +61,78 @@ import numpy as np
 
 
 
+# state-space matrices of the 3-state model
+A=[[0.9754234372338041,0.013301970222414965,0.004636748139716821],
+    [0.0034206080570929574,0.9964772560231249,8.382306645063422e-6],
+    [0.20432236921074795,0.0014364106308368987,0.793524864333977]]
+
+B=[[0.006637844404064138,0.0022459832989580805,0.16643854382482537],
+    [9.37536131372134e-5,2.6505141147745418e-6,0.006442730239255753],
+    [0.0007163558244381842,0.8289496956732726,0.017961087687400356]]
+
+# T_i is T_ind[i,t], T_a is T_amb[t]
+T_h=25
+
+
+def indoor_rhs(model_inf, t, IFRC=True):
+    # constant part of the indoor dynamics constraint of time step t, i.e. its right-hand side once all
+    # variable terms (T_ind, Heat) are moved to the left; must match add_indoor_constraints
+    if IFRC:
+        if t == 0:
+            return model_inf.C_house * model_inf.Tem_ind[0] + (model_inf.T_amb[0] - model_inf.Tem_ind[0]) / model_inf.R_house * 0.25
+        return model_inf.T_amb[t - 1] / model_inf.R_house * 0.25
+    rhs = A[0][1] * T_h + (A[0][2] + B[0][0]) * model_inf.T_amb[t] + B[0][2] * model_inf.solar_output[t]
+    if t == 0:
+        rhs += A[0][0] * model_inf.Tem_ind[0]
+    return rhs
+
+
+def indoor_temperature(model_inf, Heat, IFRC=True, T_amb=None, solar_output=None):
+    # indoor temperature trajectory for a given heat input, same dynamics as add_indoor_constraints
+    # Heat: array (..., Time_day) in MW, any leading dimensions (users, schedules) are propagated together
+    # T_amb, solar_output: optional weather arrays (..., Time_day) replacing the ones of model_inf
+    Heat = np.asarray(Heat, dtype=float)
+    Time_day = Heat.shape[-1]
+    T_amb = np.asarray(model_inf.T_amb if T_amb is None else T_amb, dtype=float)[..., :Time_day]
+    solar = np.asarray(model_inf.solar_output if solar_output is None else solar_output, dtype=float)[..., :Time_day]
+    shape = np.broadcast_shapes(Heat.shape, T_amb.shape, solar.shape)
+    Heat, T_amb, solar = (np.broadcast_to(x, shape) for x in (Heat, T_amb, solar))
+
+    T_ind = np.empty(shape)
+    T_prev = np.full(shape[:-1], float(model_inf.Tem_ind[0]))
+    if IFRC:
+        for t in range(Time_day):
+            T_a = T_amb[..., max(t - 1, 0)]
+            T_prev = T_prev + (1e3 * Heat[..., t] * 0.25 + (T_a - T_prev) / model_inf.R_house * 0.25) / model_inf.C_house
+            T_ind[..., t] = T_prev
+    else:
+        for t in range(Time_day):
+            T_prev = A[0][0] * T_prev + A[0][1] * T_h + (A[0][2] + B[0][0]) * T_amb[..., t] \
+                + B[0][1] * 1e3 * Heat[..., t] + B[0][2] * solar[..., t]
+            T_ind[..., t] = T_prev
+    return T_ind
+
+
+
+def ppd_curve(model_inf, T):
+    # PPD lower envelope of the piecewise constraints in add_indoor_constraints, evaluated at temperatures T
+    x, y = np.asarray(model_inf.x_vals, dtype=float), np.asarray(model_inf.y_vals, dtype=float)
+    slope = np.diff(y) / np.diff(x)
+    T = np.asarray(T, dtype=float)
+    # one segment at a time, so large batches need no temporary with an extra segment axis
+    out = np.full_like(T, -np.inf)
+    line = np.empty_like(T)
+    for j in range(len(slope)):
+        np.subtract(T, x[j], out=line)
+        line *= slope[j]
+        line += y[j]
+        np.maximum(out, line, out=out)
+    return out[()]
+
 def add_indoor_constraints(m, T_ind, model_inf, Heat, PPD, n_user, t, IFRC=True):
     for i in range(n_user):
         # Indoor temperature dynamics    
 
-        A=[[0.9754234372338041,0.013301970222414965,0.004636748139716821],
-            [0.0034206080570929574,0.9964772560231249,8.382306645063422e-6],
-            [0.20432236921074795,0.0014364106308368987,0.793524864333977]]
- 
-
-        B=[[0.006637844404064138,0.0022459832989580805,0.16643854382482537],    
-        [9.37536131372134e-5,2.6505141147745418e-6,0.006442730239255753],
-        [0.0007163558244381842,0.8289496956732726,0.017961087687400356]]
-
-        # T_i is T_ind[i,t], T_a is T_amb[t]
-        T_h=25
         Solar = np.ones(96)
         if IFRC:
         #simple RC model
@@ -0,0 +1,116 @@
+# Batched forward simulation of the household thermal dynamics.
+# Candidate heating schedules are evaluated without building the gurobi model: the RC or state-space indoor
+# model of ThermalModel.py is propagated over all users, time steps and any number of schedules or weather
+# traces at once, and the comfort cost follows from the same piecewise PPD curve as the optimization.
+# Used as a fast screening step before optimization and for Monte Carlo comfort-risk analysis.
+#
+# array layout: (..., n_user, Time_day), e.g. (n_schedules, n_user, Time_day); powers in MW as in the model
+
+import numpy as np
+
+from src.ModelData import compact_model_inf
+from src.ThermalModel import indoor_temperature, ppd_curve
+
+
+def schedule_heat(model_inf, p_hp, h_boil):
+    """Heat input of a schedule: heat pump electric power times COP plus boiler heat (MW)."""
+    return model_inf.COP * np.asarray(p_hp, dtype=float) + np.asarray(h_boil, dtype=float)
+
+
+def simulate(model_inf, p_hp, h_boil, T_amb=None, solar_output=None, IFRC=True):
+    """
+    Returns (T_ind, PPD) of a batch of heating schedules.
+
+    :param model_inf:    Parameter.ModelInf or CompactModelInf
+    :param p_hp:         Heat pump electric power (..., n_user, Time_day)
+    :param h_boil:       Boiler heat (..., n_user, Time_day)
+    :param T_amb:        Optional ambient temperature traces (..., Time_day) replacing model_inf.T_amb
+    :param solar_output: Optional solar traces for the state-space model
+    :param IFRC:         Simple RC model if True, state-space model otherwise
+    """
+    model_inf = compact_model_inf(model_inf)
+    heat = schedule_heat(model_inf, p_hp, h_boil)
+    if T_amb is not None:
+        # one trace per leading index, shared by all users
+        T_amb = np.asarray(T_amb, dtype=float)[..., None, :]
+    if solar_output is not None:
+        solar_output = np.asarray(solar_output, dtype=float)[..., None, :]
+    T_ind = indoor_temperature(model_inf, heat, IFRC, T_amb=T_amb, solar_output=solar_output)
+    return T_ind, ppd_curve(model_inf, T_ind)
+
+
+def schedule_costs(model_inf, p_hp, h_boil, PPD):
+    """
+    Cost components of a batch of schedules, summed over users and time (shape of the leading dimensions).
+
+    energy_cost is the electricity cost of base load plus heat pumps without network losses, i.e. an
+    approximation of power_cost of build_model. congestion_violation is the largest excess (MW) of the
+    estimated transformer import over -congestion_limit.
+    """
+    model_inf = compact_model_inf(model_inf)
+    p_hp = np.asarray(p_hp, dtype=float)
+    h_boil = np.asarray(h_boil, dtype=float)
+    Time_day = p_hp.shape[-1]
+    hour = np.arange(Time_day) // 4
+    ele_price = model_inf.ele_price[hour]
+    gas_price = model_inf.gas_price[hour]
+
+    g_boil = 1e3 * h_boil / (4 * model_inf.gas_LHV)
+    demand = model_inf.p_load[:, :Time_day].sum(axis=0) + p_hp.sum(axis=-2)
+    return {
+        "energy_cost": (1e3 * ele_price * demand * 0.25).sum(axis=-1),
+        "gas_cost": (gas_price * g_boil).sum(axis=(-2, -1)),
+        "PPD_cost": model_inf.PPD_Price * np.asarray(PPD).sum(axis=(-2, -1)),
+        "congestion_violation": np.maximum(demand + model_inf.congestion_limit[:Time_day], 0.0).max(axis=-1),
+    }
+
+
+def screen_schedules(model_inf, p_hp, h_boil, IFRC=True):
+    """
+    Simulates a batch of candidate schedules and returns their trajectories and costs.
+
+    :return: dict with T_ind, PPD and the entries of schedule_costs plus total_cost
+    """
+    model_inf = compact_model_inf(model_inf)
+    T_ind, PPD = simulate(model_inf, p_hp, h_boil, IFRC=IFRC)
+    result = {"T_ind": T_ind, "PPD": PPD}
+    result.update(schedule_costs(model_inf, p_hp, h_boil, PPD))
+    result["total_cost"] = result["energy_cost"] + result["gas_cost"] + result["PPD_cost"]
+    return result
+
+
+def ambient_traces(model_inf, n_traces, sigma=1.0, rho=0.98, Time_day=96, seed=None):
+    """
+    Random ambient temperature traces around model_inf.T_amb with AR(1) errors.
+
+    :param sigma: Stationary standard deviation of the error (degC)
+    :param rho:   Correlation between consecutive 15 min errors
+    """
+    rng = np.random.default_rng(seed)
+    noise = rng.normal(0.0, sigma * np.sqrt(1 - rho ** 2), size=(n_traces, Time_day))
+    error = np.empty_like(noise)
+    error[:, 0] = rng.normal(0.0, sigma, size=n_traces)
+    for t in range(1, Time_day):
+        error[:, t] = rho * error[:, t - 1] + noise[:, t]
+    return np.asarray(model_inf.T_amb[:Time_day], dtype=float) + error
+
+
+def comfort_risk(model_inf, p_hp, h_boil, T_amb_traces, PPD_limit=10.0, IFRC=True):
+    """
+    Monte Carlo comfort risk of one schedule over many ambient temperature traces.
+
+    :param p_hp, h_boil:  Schedule (n_user, Time_day)
+    :param T_amb_traces:  Ambient temperature traces (n_traces, Time_day), e.g. from ambient_traces
+    :param PPD_limit:     PPD (%) above which a user time step counts as uncomfortable
+    :return:              dict with per-trace PPD_cost and, per user and time step, mean / 95% quantile of
+                          PPD and probability of exceeding PPD_limit
+    """
+    model_inf = compact_model_inf(model_inf)
+    T_ind, PPD = simulate(model_inf, p_hp, h_boil, T_amb=T_amb_traces, IFRC=IFRC)
+    return {
+        "T_ind_mean": T_ind.mean(axis=0),
+        "PPD_mean": PPD.mean(axis=0),
+        "PPD_q95": np.quantile(PPD, 0.95, axis=0),
+        "PPD_exceedance": (PPD > PPD_limit).mean(axis=0),
+        "PPD_cost": model_inf.PPD_Price * PPD.sum(axis=(-2, -1)),
+    }
@@ -0,0 +1,271 @@
+# Streaming preprocessor for multi-month weather, temperature, PV and price data.
+# Parameter.py loads all of weather.csv into pandas for a single day. For seasonal studies this module reads
+# every source file once, row by row, and converts the full histories into aligned 15 min arrays per day:
+#   P_solar, pv_factor  from weather.csv P_solar (pv_factor = P_solar / 1000 W/m2, clipped to [0, 1])
+#   T_ambient           from weather.csv T_ambient
+#   T_out, T_ind        15 min means of TemperaturesOut.csv / TemperaturesInd.csv (as read_temperature_data)
+#   ele_price, gas_price  hourly prices of price_data.csv, repeated over the four quarters of each hour
+# Weather values on the 15 min grid are interpolated linearly between the surrounding samples; grid points
+# inside gaps longer than MAX_GAP stay NaN. (Parameter.py interpolates between the 15 min points that coincide
+# with a sample, so its :15 / :45 values of solar_output differ slightly from these.)
+# weather.csv and price_data.csv are in UTC, the temperature logs in local time. All series are aligned on the
+# local days of LOCAL_TZ, so on the DST changes a day has 23 or 25 hours of data (missing or overwritten slots).
+#
+# The result is an indexed file: <output>.npy (days x fields x 96, memory-mapped on read) and <output>.json
+# (start day, number of days, fields). DailyInputs gives O(1) access to the inputs of any day.
+#
+# run from the repository root:  python -m src.WeatherPreprocess --output data/preprocessed/inputs
+
+import argparse
+import csv
+import datetime
+import json
+import os
+import zoneinfo
+
+import numpy as np
+
+FIELDS = ("P_solar", "pv_factor", "T_ambient", "T_out", "T_ind", "ele_price", "gas_price")
+STEPS = 96
+STEP = datetime.timedelta(minutes=15)
+MAX_GAP = datetime.timedelta(hours=1)
+# longest run of missing 15 min values that model_inf_fields fills (e.g. the missing hour of the spring DST day)
+MAX_FILL = 4
+# time zone of the temperature logs and of the days in the output
+LOCAL_TZ = zoneinfo.ZoneInfo("Europe/Amsterdam")
+
+
+class _DayStore:
+    # day -> (fields x STEPS) array, plus running sums for the 15 min means
+    def __init__(self):
+        self.days = {}
+        self.sums = {}
+
+    def row(self, day):
+        if day not in self.days:
+            self.days[day] = np.full((len(FIELDS), STEPS), np.nan)
+        return self.days[day]
+
+    def set(self, field, when, value):
+        when = _local(when)
+        self.row(when.date())[FIELDS.index(field), _slot(when)] = value
+
+    def add(self, field, when, value):
+        when = _local(when)
+        key = (when.date(), FIELDS.index(field), _slot(when))
+        total, count = self.sums.get(key, (0.0, 0))
+        self.sums[key] = (total + value, count + 1)
+
+    def finish_means(self):
+        for (day, field, slot), (total, count) in self.sums.items():
+            self.row(day)[field, slot] = total / count
+        self.sums = {}
+
+
+def _slot(when):
+    return when.hour * 4 + when.minute // 15
+
+
+def _parse_time(text):
+    # returns UTC; weather.csv and price_data.csv have ISO timestamps with offset ("2023-09-01T00:00:00.000+00:00"),
+    # the temperature logs naive local time
+    when = datetime.datetime.fromisoformat(text.strip())
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=LOCAL_TZ)
+    return when.astimezone(datetime.timezone.utc)
+
+
+def _local(when):
+    return when.astimezone(LOCAL_TZ).replace(tzinfo=None)
+
+
+def _number(text):
+    return float(text.replace("°C", "").strip())
+
+
+def _grid_points(start, end):
+    # 15 min grid points in (start, end]
+    point = start.replace(minute=start.minute // 15 * 15, second=0, microsecond=0)
+    if point <= start:
+        point += STEP
+    while point <= end:
+        yield point
+        point += STEP
+
+
+def _set_weather(store, when, sample):
+    P_solar, T_ambient = sample
+    store.set("P_solar", when, P_solar)
+    store.set("pv_factor", when, min(max(P_solar / 1000, 0.0), 1.0))
+    store.set("T_ambient", when, T_ambient)
+
+
+def read_weather(store, path):
+    """Streams weather.csv and interpolates P_solar and T_ambient onto the 15 min grid."""
+    previous = None
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            try:
+                when = _parse_time(row["timestamp"])
+                sample = np.array([_number(row["P_solar"]), _number(row["T_ambient"])])
+            except (ValueError, KeyError):
+                continue
+            if previous is None:
+                if when.minute % 15 == 0 and when.second == 0 and when.microsecond == 0:
+                    _set_weather(store, when, sample)
+            elif previous[0] < when <= previous[0] + MAX_GAP:
+                start, before = previous
+                span = (when - start).total_seconds()
+                for point in _grid_points(start, when):
+                    weight = (point - start).total_seconds() / span
+                    _set_weather(store, point, (1 - weight) * before + weight * sample)
+            elif when > previous[0] and when.minute % 15 == 0 and when.second == 0 and when.microsecond == 0:
+                # after a long gap only a sample exactly on the grid is used
+                _set_weather(store, when, sample)
+            previous = (when, sample)
+
+
+def read_temperature(store, path, column, field):
+    """Streams a TemperaturesOut/Ind.csv file into 15 min means (same as Parameter.read_temperature_data)."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            try:
+                store.add(field, _parse_time(row["time"]), _number(row[column]))
+            except (ValueError, KeyError):
+                continue
+
+
+def read_prices(store, path):
+    """Streams price_data.csv; every hourly price fills the four 15 min steps of its hour."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            try:
+                # the year / month / day / hour columns are the UTC hour of timestamp
+                hour = _parse_time(row["timestamp"])
+                prices = (float(row["energy_price_full"]), float(row["gas_price_full"]))
+            except (ValueError, KeyError):
+                continue
+            for quarter in range(4):
+                when = hour + quarter * STEP
+                store.set("ele_price", when, prices[0])
+                store.set("gas_price", when, prices[1])
+
+
+def preprocess(output="data/preprocessed/inputs", weather_file="data/weather.csv",
+               outdoor_file="data/TemperaturesOut.csv", indoor_file="data/TemperaturesInd.csv",
+               price_file="data/price_data.csv"):
+    """
+    Converts the full source histories into the indexed daily file and returns it as DailyInputs.
+
+    :param output: Path without extension of the .npy / .json pair
+    """
+    store = _DayStore()
+    read_weather(store, weather_file)
+    read_temperature(store, outdoor_file, "Outside", "T_out")
+    read_temperature(store, indoor_file, "Room 1 - Actual", "T_ind")
+    store.finish_means()
+    read_prices(store, price_file)
+    if not store.days:
+        raise ValueError("no input data found")
+
+    first, last = min(store.days), max(store.days)
+    n_days = (last - first).days + 1
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # days without any data stay NaN, so the day offset is the row index
+    data = np.lib.format.open_memmap(output + ".npy", mode="w+", dtype=np.float64,
+                                     shape=(n_days, len(FIELDS), STEPS))
+    data[...] = np.nan
+    for day, values in store.days.items():
+        data[(day - first).days] = values
+    data.flush()
+    del data
+    with open(output + ".json", "w") as f:
+        json.dump({"start": first.isoformat(), "n_days": n_days, "fields": list(FIELDS), "steps": STEPS}, f,
+                  indent=1)
+    return DailyInputs(output)
+
+
+def fill_gaps(values, max_slots=MAX_FILL):
+    """Fills runs of at most max_slots NaN values: linear inside the series, the nearest value at its ends."""
+    values = np.array(values, dtype=float)
+    missing = np.isnan(values)
+    if not missing.any() or missing.all():
+        return values
+    known = np.flatnonzero(~missing)
+    filled = np.interp(np.arange(len(values)), known, values[known])
+    edges = np.diff(np.concatenate(([0], missing.astype(int), [0])))
+    for start, end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+        if end - start <= max_slots:
+            values[start:end] = filled[start:end]
+    return values
+
+
+class DailyInputs:
+    def __init__(self, path="data/preprocessed/inputs"):
+        """
+        Read access to a file written by preprocess. The array is memory-mapped, so opening is cheap and only
+        the requested days are read.
+
+        :param path: Path without extension of the .npy / .json pair
+        """
+        with open(path + ".json") as f:
+            index = json.load(f)
+        self.start = datetime.date.fromisoformat(index["start"])
+        self.n_days = index["n_days"]
+        self.fields = tuple(index["fields"])
+        self.data = np.load(path + ".npy", mmap_mode="r")
+
+    def _row(self, date):
+        date = datetime.date.fromisoformat(str(date)[:10])
+        row = (date - self.start).days
+        if not 0 <= row < self.n_days:
+            raise KeyError(f"{date} is outside {self.start} .. {self.start + datetime.timedelta(self.n_days - 1)}")
+        return row
+
+    def __contains__(self, date):
+        try:
+            self._row(date)
+        except (KeyError, ValueError):
+            return False
+        return True
+
+    def __getitem__(self, date):
+        """Returns {field: array of 96 values} for a day ("2024-02-01", date or datetime)."""
+        values = self.data[self._row(date)]
+        return {field: np.array(values[i]) for i, field in enumerate(self.fields)}
+
+    def model_inf_fields(self, date):
+        """
+        Fields of CompactModelInf for one day, e.g. model_inf.replace(**inputs.model_inf_fields("2024-02-01")).
+
+        Gaps of up to MAX_FILL steps are filled. Series that still miss a value the model reads are left out, so
+        the defaults of model_inf are kept.
+        """
+        day = {field: fill_gaps(values) for field, values in self[date].items()}
+        fields = {
+            "T_amb": day["T_ambient"],
+            "solar_output": day["P_solar"] / 1000,
+            "pv_factor": day["pv_factor"],
+            # build_model indexes the prices per hour
+            "ele_price": day["ele_price"][::4],
+            "gas_price": day["gas_price"][::4],
+            "Tem_ind": day["T_ind"],
+        }
+        # the model only reads the measured indoor temperature at the start of the day
+        used = {"Tem_ind": slice(0, 1)}
+        return {name: value for name, value in fields.items() if not np.isnan(value[used.get(name, slice(None))]).any()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert weather, temperature and price histories to daily arrays")
+    parser.add_argument("--output", default="data/preprocessed/inputs")
+    parser.add_argument("--weather", default="data/weather.csv")
+    parser.add_argument("--outdoor", default="data/TemperaturesOut.csv")
+    parser.add_argument("--indoor", default="data/TemperaturesInd.csv")
+    parser.add_argument("--prices", default="data/price_data.csv")
+    args = parser.parse_args()
+
+    inputs = preprocess(args.output, args.weather, args.outdoor, args.indoor, args.prices)
+    print(f"{inputs.n_days} days from {inputs.start} written to {args.output}.npy")